@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# The aircraft record that getplanes() returns for every source. Each
+# aircraft is checked and its numbers converted once, when the feed is
+# read, so that the code that picks, measures and draws aircraft can
+# use the fields directly. Aircraft without all the fields, with ones
+# that aren't numbers, or that are on the ground are left out since
+# nothing is ever shown for them
+#
+# Aircraft uses __slots__ so that a record is a few small attributes
+# rather than a whole dict, which matters with the thousands of
+# aircraft in a busy feed
+
+import time
+
+
+class Aircraft:
+    __slots__ = ('hex', 'flight', 'lat', 'lon', 'track', 'altitude',
+                 'speed', 'vert_rate', 'seen')
+
+    # hex is the ICAO hex code in lower case (FR24 gives it in upper
+    # case), flight the callsign with no padding, lat, lon and track are
+    # floats and altitude is in feet. Not every source gives speed
+    # (ground speed in knots) and vert_rate (feet per minute) so they can
+    # be None. seen is how many seconds old the position was when the
+    # feed was read
+    def __init__(self, hexcode, flight, lat, lon, track, altitude,
+                 speed=None, vert_rate=None, seen=0.0):
+        self.hex = str(hexcode).lower()
+        self.flight = str(flight).strip()
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.track = float(track)
+        self.altitude = int(altitude)
+        self.speed = float(speed) if speed is not None else None
+        self.vert_rate = float(vert_rate) if vert_rate is not None else None
+        self.seen = float(seen)
+
+    # aged returns a copy of the aircraft with the position seconds older
+    def aged(self, seconds):
+        return Aircraft(self.hex, self.flight, self.lat, self.lon, self.track, self.altitude,
+                        self.speed, self.vert_rate, self.seen + seconds)
+
+    def __repr__(self):
+        return 'Aircraft(%r, %r, %r, %r, %r, %r, %r, %r, %r)' % (
+            self.hex, self.flight, self.lat, self.lon, self.track, self.altitude,
+            self.speed, self.vert_rate, self.seen)
+
+
+# from_dict returns the Aircraft for a dict with the fields named as in
+# dump1090's aircraft.json, or None if it isn't usable. Newer versions
+# of dump1090 call the speed gs and the vertical rate baro_rate
+def from_dict(d):
+    try:
+        altitude = d['altitude']
+        if altitude == 'ground':
+            return None
+        return Aircraft(d['hex'], d['flight'], d['lat'], d['lon'], d['track'], altitude,
+                        d.get('gs', d.get('speed')), d.get('baro_rate', d.get('vert_rate')),
+                        d.get('seen_pos', 0.0))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# from_fr24 returns the Aircraft for an entry in an FR24 feeder
+# flights.json, which is a list of values, or None if it isn't usable.
+# Field 10 is when the position was received (Unix time), which gives
+# how old it is
+def from_fr24(f):
+    try:
+        if f[4] == 'ground':
+            return None
+        seen = max(0.0, time.time() - float(f[10]))
+        return Aircraft(f[0], f[16], f[1], f[2], f[3], f[4], f[5], f[15], seen)
+    except (IndexError, TypeError, ValueError):
+        return None
+
+
+# records returns the usable Aircraft made by convert from each of items
+def records(items, convert):
+    return [ac for ac in map(convert, items) if ac is not None]
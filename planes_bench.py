@@ -0,0 +1,1105 @@
+# -*- coding: utf-8 -*-
+
+# Microbenchmarks for the parts of aeronear that run every cycle. None
+# of these need the Raspberry Pi hardware. Run with the name of a
+# benchmark (or none to run them all), e.g.
+#
+#   python3 planes_bench.py refdata
+
+import os
+import sys
+import time
+import timeit
+
+# make sure we are in the same working directory as the .dat files
+abspath = os.path.abspath(__file__)
+dname = os.path.dirname(abspath)
+os.chdir(dname)
+
+
+# best returns the fastest time per call in microseconds of running
+# fn number times, repeated a few times to reduce noise
+def best(fn, number, repeat=5):
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) * 1e6 / number
+
+
+# bench_refdata compares the original findcsv scan of airports.dat
+# against the indexed lookup in planes_refdata
+def bench_refdata():
+    import planes_refdata
+
+    # A mix of busy airports from the start, middle and end of the file
+    # and a code that isn't there (the worst case for the scan)
+    codes = ['AYGA', 'EGLL', 'KJFK', 'YSSY', 'ZZZZ']
+
+    for code in codes:
+        if planes_refdata.findcsv('airports.dat', 5, code) != planes_refdata.airport(code):
+            print('MISMATCH for %s' % code)
+
+    print('%-8s %14s %14s %10s' % ('code', 'findcsv (us)', 'indexed (us)', 'speedup'))
+    for code in codes:
+        scan = best(lambda: planes_refdata.findcsv('airports.dat', 5, code), 20)
+        indexed = best(lambda: planes_refdata.airport(code), 20000)
+        print('%-8s %14.1f %14.3f %9.0fx' % (code, scan, indexed, scan / indexed))
+
+    # Every key of the compiled files should give the same row as the
+    # dicts the CSV loaders build
+    for filename, loader in [('airports.dat', planes_refdata.load_airports),
+                             ('airlines.dat', planes_refdata.load_airlines),
+                             ('planes.dat', planes_refdata.load_aircraft)]:
+        loaded = loader(filename)
+        tables = planes_refdata.compiled(filename, loader)
+        st = os.stat(filename)
+        for index, table in zip(loaded, tables):
+            for key, row in index.items():
+                if table.get(key) != row:
+                    print('MISMATCH in %s for %s' % (filename, key))
+            if table.get('ZZZZZ') is not None:
+                print('MISMATCH in %s for a missing key' % filename)
+
+        load = best(lambda: loader(filename), 5, 3)
+        opened = best(lambda: planes_refdata.open_compiled(filename + '.idx', st), 200)
+        first = best(lambda: planes_refdata.open_compiled(filename + '.idx', st)[0].get('EGLL'), 200)
+        print('%-13s CSV load %7.1f ms, open compiled %6.1f us, open and first lookup %6.1f us' % (
+            filename, load / 1000, opened, first))
+
+
+# synthetic_positions returns n random aircraft positions within about
+# spread degrees of the device
+def synthetic_positions(n, spread=2.0, seed=1):
+    import random
+    from planes_config import MY_LAT, MY_LONG
+
+    rnd = random.Random(seed)
+    lats = [max(-89.9, min(89.9, MY_LAT + rnd.uniform(-spread, spread))) for i in range(n)]
+    lons = [(MY_LONG + rnd.uniform(-spread, spread) + 180) % 360 - 180 for i in range(n)]
+    return lats, lons
+
+
+# bench_geo checks the NumPy distance and bearing batch against the
+# scalar distance() and bearing() functions and then times both paths
+def bench_geo():
+    import planes_geo
+    from planes_aircraft import Aircraft
+    from planes_config import MY_LAT, MY_LONG
+
+    lats, lons = synthetic_positions(1000, spread=60.0)
+    dists, bearings, order = planes_geo.batch(lats, lons)
+
+    max_dist = 0.0
+    max_bearing = 0.0
+    for i in range(len(lats)):
+        d = planes_geo.distance(Aircraft('', '', lats[i], lons[i], 0, 0))
+        b = planes_geo.bearing(MY_LAT, MY_LONG, lats[i], lons[i])
+        max_dist = max(max_dist, abs(d - dists[i]))
+        diff = abs(b - bearings[i]) % 360
+        max_bearing = max(max_bearing, min(diff, 360 - diff))
+    print('numpy: %s' % ('yes' if planes_geo.numpy is not None else 'no (pure Python only)'))
+    print('max difference: %.3g nm, %.3g degrees' % (max_dist, max_bearing))
+    if sorted(range(len(dists)), key=dists.__getitem__) != order:
+        print('MISMATCH in nearest ordering')
+
+    print('%-6s %16s %16s %10s' % ('n', 'python (us)', 'batch (us)', 'speedup'))
+    for n in [10, 100, 300, 1000]:
+        lats, lons = synthetic_positions(n)
+        python = best(lambda: planes_geo.batch_python(lats, lons), 20)
+        batch = best(lambda: planes_geo.batch(lats, lons), 20)
+        print('%-6d %16.1f %16.1f %9.1fx' % (n, python, batch, python / batch))
+
+
+# synthetic_feed returns n aircraft as dicts in the form aircraft.json
+# has them, scattered over about spread degrees around the device with a
+# few on the ground or missing fields like a real feed
+def synthetic_feed(n, spread=8.0, seed=1):
+    import random
+
+    rnd = random.Random(seed)
+    lats, lons = synthetic_positions(n, spread, seed)
+    feed = []
+    for i in range(n):
+        ac = {'hex': '%06x' % i, 'lat': lats[i], 'lon': lons[i],
+              'track': rnd.uniform(0, 360), 'altitude': rnd.randint(0, 40000),
+              'flight': 'TST%d ' % i}
+        r = rnd.random()
+        if r < 0.05:
+            ac['altitude'] = 'ground'
+        elif r < 0.1:
+            del ac['flight']
+        feed.append(ac)
+    return feed
+
+
+# required and dict_distance are the original main loop's field check
+# and distance on the dicts that getplanes() used to return
+
+required = ['hex', 'lat', 'lon', 'track', 'altitude', 'flight']
+
+
+def dict_distance(a):
+    import haversine
+    from planes_config import MY_LAT, MY_LONG
+    return haversine.haversine((MY_LAT, MY_LONG), (float(a['lat']), float(a['lon'])), unit=haversine.Unit.NAUTICAL_MILES)
+
+
+# bench_select compares the original filter and full sort by distance
+# with planes_select.nearest on synthetic feeds of increasing size
+def bench_select():
+    import planes_select
+    from planes_aircraft import records, from_dict
+    from planes_config import MAX_RANGE
+
+    # The original main loop: check the required fields, drop ground
+    # traffic and then sort everything by distance
+    def full_sort(feed):
+        near = []
+        for ac in feed:
+            ok = True
+            for r in required:
+                if r not in ac:
+                    ok = False
+                    break
+            if ok and ac['altitude'] != "ground":
+                near.append(ac)
+        near.sort(key=dict_distance)
+        return near[:8]
+
+    print('MAX_RANGE %s nm, grid of %d cells' %
+          (MAX_RANGE, len(planes_select.in_range) if planes_select.in_range else 0))
+    print('%-6s %16s %16s %10s' % ('n', 'full sort (us)', 'nearest (us)', 'speedup'))
+    for n in [100, 1000, 10000]:
+        feed = synthetic_feed(n)
+        planes = records(feed, from_dict)
+        near = planes_select.nearest(planes, 8)[0]
+        expected = [ac for ac in full_sort(feed) if dict_distance(ac) <= MAX_RANGE or MAX_RANGE <= 0]
+        if [ac.hex for ac in near] != [ac['hex'] for ac in expected]:
+            print('MISMATCH for %d aircraft' % n)
+        number = max(1, 2000 // n)
+        old = best(lambda: full_sort(feed), number)
+        new = best(lambda: planes_select.nearest(planes, 8), number)
+        print('%-6d %16.1f %16.1f %9.1fx' % (n, old, new, old / new))
+
+
+# bench_records compares the dicts that getplanes() used to return with
+# the planes_aircraft records it returns now: the memory they take, the
+# cost of making the records when the feed is parsed, and the checks the
+# main loop makes on every aircraft every poll (the required fields,
+# ground traffic and converting the position) against the grid check
+# planes_select makes on a record
+def bench_records():
+    import json
+    import tracemalloc
+    import planes_select
+    from planes_aircraft import records, from_dict
+
+    # The checks the main loop made on each dict before picking
+    def dict_checks(feed):
+        usable = []
+        for ac in feed:
+            ok = True
+            for r in required:
+                if r not in ac:
+                    ok = False
+                    break
+            if ok and ac['altitude'] != "ground":
+                try:
+                    usable.append((float(ac['lat']), float(ac['lon']), float(ac['track'])))
+                except (TypeError, ValueError):
+                    pass
+        return usable
+
+    def record_checks(planes):
+        return [(ac.lat, ac.lon, ac.track) for ac in planes if planes_select.usable(ac)]
+
+    # measure returns what make() returns and the memory still taken by
+    # it afterwards in bytes
+    def measure(make):
+        tracemalloc.start()
+        result = make()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, size
+
+    print('%-6s %11s %11s %12s %12s %12s %12s' % (
+        'n', 'dicts (KB)', 'recs (KB)', 'loads (us)', '+recs (us)', 'dict chk (us)', 'rec chk (us)'))
+    for n in [1000, 10000, 50000]:
+        body = json.dumps(synthetic_feed(n))
+        dicts, dict_size = measure(lambda: json.loads(body))
+        planes, record_size = measure(lambda: records(json.loads(body), from_dict))
+
+        number = max(1, 20000 // n)
+        loads = best(lambda: json.loads(body), number)
+        make = best(lambda: records(json.loads(body), from_dict), number)
+        old = best(lambda: dict_checks(dicts), number)
+        new = best(lambda: record_checks(planes), number)
+        print('%-6d %11.0f %11.0f %12.0f %12.0f %12.0f %12.0f' % (
+            n, dict_size / 1024, record_size / 1024, loads, make - loads, old, new))
+
+
+# bench_track flies synthetic aircraft in gentle turns, gives
+# planes_track a fix every five seconds (with and without the ground
+# speed and vertical rate, and with a little noise) and reports how far
+# the predictions were from the next fix compared with showing the last
+# fix. It also times one display tick
+def bench_track():
+    import math
+    import random
+    import planes_track
+    from planes_aircraft import Aircraft
+
+    def fly(with_speed, noise):
+        planes_track.tracks.clear()
+        for k in planes_track.stats:
+            planes_track.stats[k] = 0
+        rnd = random.Random(1)
+        flights = [[rnd.uniform(50, 52), rnd.uniform(-1, 1), rnd.uniform(0, 360),
+                    rnd.uniform(150, 480), rnd.uniform(-0.5, 0.5)] for i in range(20)]
+        for step in range(60):
+            planes = []
+            for n, f in enumerate(flights):
+                lat, lon, course, speed, turn = f
+                planes.append(Aircraft('%06x' % n, 'TST%d' % n,
+                                       lat + rnd.gauss(0, noise), lon + rnd.gauss(0, noise), course,
+                                       30000, speed if with_speed else None, 0 if with_speed else None))
+                nm = speed * 5 / 3600
+                f[0] += nm * math.cos(math.radians(course)) / 60
+                f[1] += nm * math.sin(math.radians(course)) / (60 * math.cos(math.radians(f[0])))
+                f[2] = (course + turn * 5) % 360
+            planes_track.update(planes, step * 5.0)
+        return planes_track.summary()
+
+    print('with speed, exact fixes:     %s' % fly(True, 0))
+    print('with speed, noisy fixes:     %s' % fly(True, 0.0005))
+    print('from fixes only, noisy:      %s' % fly(False, 0.0005))
+
+    ac = next(iter(planes_track.tracks.values())).last()[1]
+    tick = best(lambda: planes_track.predict(ac, 300.0), 10000)
+    print('predicting a position takes %.1f us' % tick)
+
+
+# serve_directory starts a web server on a random local port in a
+# background thread serving the files in directory and returns the base
+# URL. Python's server answers If-Modified-Since with 304 like lighttpd.
+# Each answer can be held up by delay seconds to make a slow source
+def serve_directory(directory, delay=0):
+    import functools
+    import http.server
+    import threading
+
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def send_head(self):
+            time.sleep(delay)
+            return super().send_head()
+
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://127.0.0.1:%d/' % server.server_address[1]
+
+
+# write_aircraft_json writes a dump1090 style aircraft.json for feed to
+# filename, backdating its mtime by age seconds
+def write_aircraft_json(filename, feed, now, messages, age=0):
+    import json
+
+    with open(filename, 'w') as f:
+        json.dump({'now': now, 'messages': messages, 'aircraft': feed}, f)
+    t = os.path.getmtime(filename) - age
+    os.utime(filename, (t, t))
+
+
+# reset_feed makes planes_feed forget the last poll and its counters
+def reset_feed():
+    import planes_feed
+
+    planes_feed.feeds.clear()
+    for k in planes_feed.stats:
+        planes_feed.stats[k] = 0
+
+
+# bench_feed polls a local copy of a 1000 aircraft aircraft.json the
+# way the main loop does. dump1090 rewrites the file every second and
+# the main loop polls every five seconds or so, but when the receiver
+# is idle or the loop polls faster than the file is written most polls
+# see an unchanged file. Here the file changes on one poll in four and
+# is rewritten with the same contents on another
+def bench_feed():
+    import tempfile
+    import planes_feed
+    from planes_aircraft import records, from_dict
+
+    polls = 200
+    reset_feed()
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'aircraft.json')
+        url = serve_directory(directory) + 'aircraft.json'
+        feed = synthetic_feed(1000)
+        usable = len(records(feed, from_dict))
+        t = time.time()
+        for i in range(polls):
+            if i % 4 == 0:
+                # Each rewrite is at least a second newer than the last
+                # so that If-Modified-Since sees it as changed
+                write_aircraft_json(filename, feed, t + i, i, age=polls - i)
+            elif i % 4 == 2:
+                # Rewritten by dump1090 with identical contents, only
+                # the now/messages check catches this one
+                write_aircraft_json(filename, feed, t + i - 2, i - 2, age=polls - i + 1)
+            planes = planes_feed.poll(url, planes_feed.parse_dump1090, True)
+            if len(planes) != usable:
+                print('MISMATCH on poll %d' % i)
+
+    s = planes_feed.stats
+    print('%d polls: %d not modified, %d unchanged' % (s['polls'], s['not_modified'], s['unchanged']))
+    print('downloaded %.0f KB, saved %.0f KB' % (s['bytes'] / 1024, s['bytes_saved'] / 1024))
+    print('parsing took %.3f s CPU, saved %.3f s CPU' % (s['parse_time'], s['parse_saved']))
+    print('at one poll every 5 seconds that is %.1f MB and %.1f CPU seconds saved per hour' % (
+        s['bytes_saved'] / polls * 720 / 1024 / 1024, s['parse_saved'] / polls * 720))
+
+
+# bench_stream compares polling aircraft.json and parsing it whole with
+# parsing it as it downloads (STREAM_FEED), on synthetic feeds of
+# increasing size and on a feed recorded from a receiver if
+# AIRCRAFT_JSON is set to its file name. The peak memory is measured
+# with tracemalloc, which slows both down by the same amount
+def bench_stream():
+    import json
+    import shutil
+    import tempfile
+    import tracemalloc
+    import planes_feed
+    import planes_select
+
+    # One poll of a changed aircraft.json
+    def poll(url, stream):
+        reset_feed()
+        return planes_feed.poll(url, planes_feed.parse_dump1090, True, stream)
+
+    def peak(fn):
+        tracemalloc.start()
+        fn()
+        size = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return size
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = serve_directory(directory)
+        feeds = []
+        for n in [1000, 10000, 50000]:
+            filename = os.path.join(directory, '%d.json' % n)
+            write_aircraft_json(filename, synthetic_feed(n), time.time(), n)
+            feeds.append(('synthetic %d' % n, filename))
+        recorded = os.environ.get('AIRCRAFT_JSON')
+        if recorded:
+            shutil.copy(recorded, os.path.join(directory, 'recorded.json'))
+            feeds.append(('recorded', os.path.join(directory, 'recorded.json')))
+
+        print('%-16s %9s %7s %13s %13s %12s %12s' % (
+            'feed', 'size (KB)', 'kept', 'whole (ms)', 'stream (ms)', 'whole (KB)', 'stream (KB)'))
+        for name, filename in feeds:
+            feed_url = url + os.path.basename(filename)
+            whole = [ac for ac in poll(feed_url, False) if planes_select.usable(ac)]
+            streamed = poll(feed_url, True)
+            if sorted(ac.hex for ac in whole) != sorted(ac.hex for ac in streamed):
+                print('MISMATCH for %s' % name)
+
+            number = 3 if os.path.getsize(filename) > 1000000 else 10
+            old = best(lambda: planes_select.nearest(poll(feed_url, False)), number, 3)
+            new = best(lambda: planes_select.nearest(poll(feed_url, True)), number, 3)
+            old_peak = peak(lambda: planes_select.nearest(poll(feed_url, False)))
+            new_peak = peak(lambda: planes_select.nearest(poll(feed_url, True)))
+            print('%-16s %9.0f %7d %13.1f %13.1f %12.0f %12.0f' % (
+                name, os.path.getsize(filename) / 1024, len(streamed), old / 1000, new / 1000,
+                old_peak / 1024, new_peak / 1024))
+    reset_feed()
+
+
+# bench_fusion serves overlapping halves of a synthetic feed as a
+# dump1090 aircraft.json and an FR24 flights.json and reads them with
+# planes_fusion, first with both answering quickly and then with FR24
+# taking two seconds to answer
+def bench_fusion():
+    import json
+    import tempfile
+    import planes_feed
+    import planes_fusion
+
+    feed = synthetic_feed(2000)
+    dump1090 = [ac for i, ac in enumerate(feed) if i % 4 != 0]
+    fr24 = {}
+    for i, ac in enumerate(feed):
+        if i % 4 != 1 and 'flight' in ac:
+            fr24[str(i)] = [ac['hex'].upper(), ac['lat'], ac['lon'], ac['track'], ac['altitude'],
+                            450, '', '', '', '', int(time.time()) - 2, '', '', '', 0, 0, ac['flight']]
+
+    fast = tempfile.TemporaryDirectory()
+    slow = tempfile.TemporaryDirectory()
+    for directory in [fast.name, slow.name]:
+        write_aircraft_json(os.path.join(directory, 'aircraft.json'), dump1090, time.time(), 1)
+        with open(os.path.join(directory, 'flights.json'), 'w') as f:
+            json.dump(fr24, f)
+    fast_url = serve_directory(fast.name)
+    slow_url = serve_directory(slow.name, delay=2)
+
+    if planes_fusion.FUSION != ['DUMP1090', 'FR24']:
+        print('Set FUSION to ["DUMP1090", "FR24"] in planes_config.py to run this')
+        return
+
+    alone = {}
+    for name, url, parser in [('DUMP1090', fast_url + 'aircraft.json', planes_feed.parse_dump1090),
+                              ('FR24', fast_url + 'flights.json', planes_feed.parse_fr24)]:
+        reset_feed()
+        alone[name] = planes_feed.poll(url, parser, name == 'DUMP1090')
+    print('DUMP1090 alone sees %d aircraft, FR24 alone %d' % (len(alone['DUMP1090']), len(alone['FR24'])))
+
+    for how, fr24_url in [('both fast', fast_url), ('FR24 slow', slow_url)]:
+        reset_feed()
+        planes_fusion.latest.clear()
+        planes_fusion.late.clear()
+        planes_feed.DUMP1090 = fast_url + 'aircraft.json'
+        planes_feed.FR24 = fr24_url + 'flights.json'
+        times = []
+        for i in range(5):
+            t = time.monotonic()
+            planes = planes_fusion.getplanes()
+            times.append(time.monotonic() - t)
+        hexes = [ac.hex for ac in planes]
+        if len(hexes) != len(set(hexes)):
+            print('DUPLICATES in merged list')
+        print('%s: merged %d aircraft, getplanes took %s ms' % (
+            how, len(planes), ', '.join(['%.0f' % (t * 1000) for t in times])))
+        print(planes_fusion.report())
+        for future in planes_fusion.pending.values():
+            future.result()
+        planes_fusion.pending.clear()
+
+    fast.cleanup()
+    slow.cleanup()
+
+
+# sample_photo writes a photo-sized JPEG to a temporary file for the
+# render benchmarks and returns its name
+def sample_photo():
+    import tempfile
+    from PIL import Image
+
+    f = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
+    Image.new('RGB', (640, 427), color=(90, 120, 160)).save(f, 'JPEG')
+    f.close()
+    return f.name
+
+
+# resized_photo opens the photo in filename and resizes it for the
+# screen the way the original code did every time it drew a frame
+def resized_photo(filename):
+    from PIL import Image
+
+    pic = Image.open(filename, 'r')
+    basewidth = 220
+    wpercent = (basewidth / float(pic.size[0]))
+    hsize = int((float(pic.size[1]) * float(wpercent)))
+    return pic.resize((basewidth, hsize), Image.LANCZOS)
+
+
+# sample_spotted returns a typical set of arguments for draw_spotted,
+# with a photo already resized as planes_photos keeps them
+def sample_spotted():
+    filename = sample_photo()
+    photo = resized_photo(filename)
+    os.remove(filename)
+    return ('BAW123', 'British Airways', 'London Heathrow Airport', 'United Kingdom',
+            'John F Kennedy International Airport', 'United States', 'Airbus',
+            'A350 1041', 35000, 'G-XWBA', photo, 12.3)
+
+
+# bench_render times drawing a frame of an aircraft with every asset
+# loaded from scratch each time (as the original code did), a full
+# redraw using the font, fit, flag and icon caches in planes_render, a
+# partial redraw where only the distance and altitude changed and a
+# frame that is skipped because nothing changed
+def bench_render():
+    import planes_render
+    from planes_aircraft import Aircraft
+
+    picture = sample_photo()
+    spotted = sample_spotted()
+    no_photo = spotted[:-2] + (False, spotted[-1])
+
+    def full(args):
+        planes_render.static_key = None
+        planes_render.last_frame = None
+        planes_render.draw_spotted(*args)
+
+    # The original code also opened and resized the photo every frame
+    def uncached(args):
+        planes_render.fonts.clear()
+        planes_render.fits.clear()
+        planes_render.flags.clear()
+        planes_render.icons.clear()
+        if args[10] is not False:
+            args = args[:10] + (resized_photo(picture),) + args[11:]
+        full(args)
+
+    moved = [0]
+
+    def partial(args):
+        moved[0] += 1
+        args = args[:8] + (args[8] + moved[0] % 100,) + args[9:]
+        planes_render.draw_spotted(*args)
+
+    def same(args):
+        planes_render.draw_spotted(*args)
+
+    for name, args in [('with photo', spotted), ('no photo', no_photo)]:
+        print('spotted frame %s:' % name)
+        old = best(lambda: uncached(args), 20)
+        print('  uncached %8.2f ms' % (old / 1000))
+        for how, fn in [('full', full), ('partial', partial), ('skipped', same)]:
+            new = best(lambda: fn(args), 20)
+            print('  %-8s %8.2f ms (%.1fx)' % (how, new / 1000, old / new))
+
+    print(planes_render.frame_summary())
+
+    # The original select screen drew every row from scratch on every
+    # press (with the fonts and fits cached, which it didn't have)
+    def old_select(nearac, index):
+        img, d = planes_render.new_frame()
+        y = 6
+        d.line([(0, 3), (320, 3)])
+        for step in range(len(nearac) + 1):
+            label = nearac[step].flight if step < len(nearac) else 'Auto select'
+            colour = (255, 255, 255) if step == index else (150, 150, 150)
+            y = planes_render.text(d, 160, y, label, 32, position='c', colour=colour)
+            y += 3
+            d.line([(0, y), (320, y)])
+            y += 3
+        return img
+
+    print('select screen, time per button press:')
+    print('%10s %12s %12s %12s' % ('aircraft', 'original', 'page shown', 'next row'))
+    for n in [8, 20, 60]:
+        near = [Aircraft('%06x' % i, 'TST%d' % i, 0, 0, 0, 0) for i in range(n)]
+        presses = [0]
+
+        def press():
+            presses[0] = (presses[0] + 1) % (n + 1)
+            old_select(near, presses[0])
+
+        def new_page():
+            planes_render.select_key = None
+            planes_render.draw_select(near, 3)
+
+        def next_row():
+            presses[0] = (presses[0] + 1) % min(planes_render.rows_per_page, n + 1)
+            planes_render.draw_select(near, presses[0])
+
+        print('%10d %9.2f ms %9.2f ms %9.2f ms' % (
+            n, best(press, 20) / 1000, best(new_page, 20) / 1000, best(next_row, 50) / 1000))
+    os.remove(picture)
+
+
+# bench_photos serves a photo from a local web server and compares the
+# original way of showing it (download it for each new aircraft and
+# open and resize it whenever the frame is drawn) with planes_photos:
+# the first time, once it's on disk and once it's in memory
+def bench_photos():
+    import shutil
+    import tempfile
+    import planes_http
+    import planes_photos
+
+    with tempfile.TemporaryDirectory() as directory:
+        served = os.path.join(directory, 'served')
+        os.mkdir(served)
+        shutil.move(sample_photo(), os.path.join(served, 'photo.jpg'))
+        url = serve_directory(served) + 'photo.jpg'
+        planes_photos.photo_dir = os.path.join(directory, 'photos')
+
+        def download(filename):
+            with planes_http.get(url, stream=True) as r:
+                with open(filename, 'wb') as f:
+                    for chunk in r.iter_content(16384):
+                        f.write(chunk)
+            return True
+
+        def original():
+            picture = os.path.join(directory, 'planepic.jpg')
+            with open(picture, 'wb') as f:
+                f.write(planes_http.get(url).content)
+            resized_photo(picture)
+
+        def first():
+            shutil.rmtree(planes_photos.photo_dir, ignore_errors=True)
+            planes_photos.memory.clear()
+            planes_photos.photo('abcdef', download)
+
+        def disk():
+            planes_photos.memory.clear()
+            planes_photos.photo('abcdef', download)
+
+        old = best(original, 20)
+        print('original (download, open and resize): %7.2f ms' % (old / 1000))
+        for name, fn in [('first time', first), ('from disk', disk),
+                         ('from memory', lambda: planes_photos.photo('abcdef', download))]:
+            new = best(fn, 20)
+            print('%-37s %7.3f ms (%.0fx)' % (name + ':', new / 1000, old / new))
+        print('original redraw also opened and resized: %7.2f ms per full frame' % (
+            best(lambda: resized_photo(os.path.join(directory, 'planepic.jpg')), 20) / 1000))
+        print(planes_photos.summary())
+
+
+# bench_display compares the time to get a frame onto the screen with
+# the FBI path (PNG encode and mv, without the pgrep or fbi itself
+# which would only add to it) and writing straight to a framebuffer,
+# here an ordinary file standing in for /dev/fb1
+def bench_display():
+    import subprocess
+    import tempfile
+    import planes_display
+    import planes_render
+
+    planes_render.last_frame = None
+    img = planes_render.draw_spotted(*sample_spotted())
+
+    def png():
+        img.save(planes_display.screen_tmp)
+        subprocess.run('mv %s %s' % (planes_display.screen_tmp, planes_display.screen_file), shell=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        planes_display.FRAMEBUFFER = os.path.join(directory, 'fb1')
+        planes_display.fb_start()
+
+        old = best(png, 10)
+        new = best(lambda: planes_display.fb_show(img), 50)
+        print('FBI (PNG + mv):   %8.2f ms per frame' % (old / 1000))
+        print('framebuffer:      %8.2f ms per frame (%.0fx)' % (new / 1000, old / new))
+        print('of which RGB565:  %8.2f ms' % (best(lambda: planes_display.rgb565(img), 50) / 1000))
+        planes_display.fb.close()
+
+
+# bench_motion turns the model aircraft half way round with the
+# original fixed rate loop and with planes_motion's controller, both
+# driving planes_simgpio, and times how long the caller is held up
+def bench_motion():
+    import planes_simgpio
+    import planes_motion
+
+    half = planes_motion.revolution // 2
+
+    # The original plane_rotate: one step then a 2 ms sleep (the
+    # controller's own thread is idle meanwhile)
+    def fixed_rate():
+        c = planes_motion.MotionController(planes_simgpio, 0)
+        for i in range(half):
+            c.step(1)
+            time.sleep(0.002)
+        c.off()
+
+    t = time.monotonic()
+    fixed_rate()
+    old = time.monotonic() - t
+    print('fixed rate:  half turn %.2f s, caller blocked %.2f s' % (old, old))
+
+    controller = planes_motion.MotionController(planes_simgpio, 0)
+    t = time.monotonic()
+    controller.track(180)
+    blocked = time.monotonic() - t
+    controller.wait()
+    new = time.monotonic() - t
+    print('controller:  half turn %.2f s, caller blocked %.6f s, position %d' % (
+        new, blocked, controller.position))
+
+    # A new heading half way through a move
+    t = time.monotonic()
+    controller.track(0)
+    time.sleep(new / 2)
+    controller.track(90)
+    controller.wait()
+    print('retarget:    finished at %d (wanted %d) after %.2f s' % (
+        controller.position, round(90 * planes_motion.degree), time.monotonic() - t))
+
+
+# sbs_line returns a BaseStation MSG,3 (airborne position) line for ac
+def sbs_line(ac):
+    return 'MSG,3,1,1,%s,1,,,,,%s,%s,,%s,%.5f,%.5f,,,0,,0,0\r\n' % (
+        ac['hex'].upper(), ac.get('flight', ''), ac['altitude'] if ac['altitude'] != 'ground' else '',
+        ac['track'], ac['lat'], ac['lon'])
+
+
+# serve_sbs starts a fake dump1090 BaseStation output on port (a random
+# one if 0) in a background thread. It returns the host:port and a
+# function that sends a string to every connected client and returns
+# how many there are
+def serve_sbs(port=0):
+    import socket
+    import threading
+
+    clients = []
+    lock = threading.Lock()
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', port))
+    server.listen()
+
+    def accept():
+        while True:
+            client, address = server.accept()
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with lock:
+                clients.append(client)
+
+    def send(text):
+        data = text.encode('ascii')
+        with lock:
+            for client in list(clients):
+                try:
+                    client.sendall(data)
+                except OSError:
+                    clients.remove(client)
+                    client.close()
+            return len(clients)
+
+    threading.Thread(target=accept, daemon=True).start()
+    return '127.0.0.1:%d' % server.getsockname()[1], send
+
+
+# fake_sbs runs a fake BaseStation output on port 30003 (or the port
+# given) with synthetic aircraft moving around the device, for trying
+# out SOURCE = "SBS" without a receiver. Run with
+#
+#   python3 planes_bench.py fakesbs [port]
+def fake_sbs(port=30003):
+    import math
+
+    address, send = serve_sbs(port)
+    print('Fake SBS output on %s' % address)
+    feed = [ac for ac in synthetic_feed(200, spread=1.0) if 'flight' in ac]
+    while True:
+        for ac in feed:
+            # Roughly 450 knots along the track
+            ac['lat'] += 0.002 * math.cos(math.radians(ac['track']))
+            ac['lon'] += 0.002 * math.sin(math.radians(ac['track']))
+            send(sbs_line(ac))
+        time.sleep(1)
+
+
+# bench_sbs compares how long a new position takes to reach the
+# aircraft list with the JSON and SBS sources. dump1090 writes
+# aircraft.json every second and the main loop polls it every
+# tracking_interval seconds, so on average a position waits half of
+# each before the poll downloads and parses the whole file. From the
+# fake SBS output the position is sent as soon as it's "received" and
+# applied to the table on its own
+def bench_sbs():
+    import tempfile
+    import planes_feed
+    import planes_http
+    import planes_sbs
+    import planes_schedule
+
+    feed = synthetic_feed(1000)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'aircraft.json')
+        url = serve_directory(directory) + 'aircraft.json'
+        write_aircraft_json(filename, feed, time.time(), 1)
+        poll = best(lambda: planes_feed.parse_dump1090(planes_http.get(url).content), 20) / 1e6
+
+    json_latency = 0.5 + planes_schedule.tracking_interval / 2 + poll
+    print('JSON: %.1f ms to fetch and parse %d aircraft, %.2f s average latency' % (
+        poll * 1000, len(feed), json_latency))
+
+    address, send = serve_sbs()
+    planes_sbs.SBS = address
+    planes_sbs.start()
+    while send('') == 0:
+        time.sleep(0.01)
+    for ac in feed:
+        send(sbs_line(ac))
+    while planes_sbs.stats['messages'] < len(feed):
+        time.sleep(0.01)
+
+    latencies = []
+    ac = feed[0]
+    for i in range(200):
+        ac['lat'] += 0.001
+        want = round(ac['lat'], 5)
+        t = time.perf_counter()
+        send(sbs_line(ac))
+        while planes_sbs.aircraft[ac['hex']].get('lat') != want:
+            time.sleep(0)
+        latencies.append(time.perf_counter() - t)
+    latencies.sort()
+
+    copy = best(planes_sbs.getplanes, 50) / 1e6
+    print('SBS:  %.3f ms median, %.3f ms worst latency, %.1f ms to read the table' % (
+        latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000, copy * 1000))
+    print('latency %.0fx lower, each cycle %.0fx cheaper' % (
+        json_latency / latencies[len(latencies) // 2], poll / copy))
+    print(planes_sbs.report())
+
+
+# bench_metrics times the cost of timing a stage with metrics off and
+# on, checks what /metrics serves and times producing it
+def bench_metrics():
+    import urllib.request
+    import planes_metrics
+
+    def nothing():
+        pass
+
+    def stage():
+        with planes_metrics.timed('bench'):
+            pass
+
+    base = best(nothing, 100000)
+    planes_metrics.enabled = False
+    off = best(stage, 100000)
+    planes_metrics.enabled = True
+    on = best(stage, 100000)
+    print('timing a stage: %.2f us with metrics off, %.2f us on' % (off - base, on - base))
+
+    for i in range(12):
+        planes_metrics.observe('stage%d' % i, i / 1000)
+    planes_metrics.count('polls')
+    planes_metrics.include('bench', {'cycles': 3, 'busy': 1.5})
+
+    planes_metrics.METRICS = '127.0.0.1:0'
+    planes_metrics.start()
+    url = 'http://127.0.0.1:%d/metrics' % planes_metrics.server.server_address[1]
+    text = urllib.request.urlopen(url).read().decode('utf-8')
+    for line in ['aeronear_stage_seconds_count{stage="bench"} %d' % planes_metrics.stages['bench'].count,
+                 'aeronear_polls_total 1', 'aeronear_bench_busy 1.5']:
+        if line not in text.split('\n'):
+            print('MISSING %s' % line)
+    print('%d lines served, producing them takes %.0f us' % (
+        len(text.split('\n')), best(planes_metrics.metrics, 200)))
+    planes_metrics.enabled = False
+
+
+# bench_profile profiles some cycles of drawing full frames the way
+# planes.py does when sent SIGUSR1, checks the files written and
+# compares the time of a frame with and without profiling
+def bench_profile():
+    import shutil
+    import signal
+    import tempfile
+    import planes_profile
+    import planes_render
+
+    spotted = sample_spotted()
+    planes_profile.profile_dir = tempfile.mkdtemp()
+    planes_profile.cycles = 10
+
+    def frame():
+        planes_render.static_key = None
+        planes_render.last_frame = None
+        planes_render.draw_spotted(*spotted)
+
+    plain = best(frame, 20)
+
+    planes_profile.install()
+    os.kill(os.getpid(), signal.SIGUSR1)
+    took = []
+    for i in range(planes_profile.cycles):
+        planes_profile.begin()
+        t = time.perf_counter()
+        frame()
+        took.append((time.perf_counter() - t) * 1e6)
+        planes_profile.end(120)
+    signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+
+    files = sorted(os.listdir(planes_profile.profile_dir))
+    print('written: %s' % ', '.join(files))
+    collapsed = [f for f in files if f.endswith('.collapsed')]
+    with open(os.path.join(planes_profile.profile_dir, collapsed[0])) as f:
+        stacks = f.read().splitlines()
+    if not any('planes_render.py:draw_spotted' in line for line in stacks):
+        print('MISSING draw_spotted in the collapsed stacks')
+    print('%d stacks sampled' % len(stacks))
+    print('full frame: %.2f ms, %.2f ms while profiling' % (plain / 1000, min(took) / 1000))
+    shutil.rmtree(planes_profile.profile_dir)
+
+
+# bench_startup starts Python afresh to time how long it takes to get
+# the first frame ready the way planes.py now starts (only the screen
+# modules first) and the way it used to (everything imported first),
+# and compares opening the reference data from the CSV files with the
+# compiled files
+def bench_startup():
+    import subprocess
+    import planes_refdata
+
+    first = ('import planes_startup, planes_render, planes_display; '
+             'planes_display.rgb565(planes_render.draw_blank("Starting up")); '
+             'print(planes_startup.mark("first_frame"))')
+    everything = ('import planes_startup, planes_feed, planes_select, planes_geo, planes_track, '
+                  'planes_enrich, planes_cache, planes_photos, planes_input, planes_schedule, '
+                  'planes_metrics, planes_profile, planes_motion; ' + first)
+
+    for name, code in [('screen modules only', first), ('everything first', everything)]:
+        times = []
+        for i in range(5):
+            out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+            times.append(float(out.stdout.split()[-1]))
+        print('first frame, %-20s %6.0f ms after the process started' % (name + ':', min(times) * 1000))
+
+    def from_csv():
+        planes_refdata.load_airports(planes_refdata.AIRPORTS_FILE)
+        planes_refdata.load_airlines(planes_refdata.AIRLINES_FILE)
+        planes_refdata.load_aircraft(planes_refdata.AIRCRAFT_FILE)
+
+    def from_compiled():
+        planes_refdata.tables.clear()
+        planes_refdata.prepare()
+
+    from_compiled()
+    print('reference data: %.1f ms from the CSV files, %.2f ms from the compiled files' % (
+        best(from_csv, 3, 3) / 1000, best(from_compiled, 50) / 1000))
+
+
+# bench_state moves the model aircraft the way tracking does (a move
+# every cycle) with the times in planes_state scaled down, and compares
+# the writes made with the original one write per move. It also checks
+# that the state is read back and times a write
+def bench_state():
+    import shutil
+    import tempfile
+    import planes_state
+
+    directory = tempfile.mkdtemp()
+    planes_state.state_file = os.path.join(directory, 'planes_state.json')
+    planes_state.old_file = os.path.join(directory, 'planes_position.py')
+
+    with open(planes_state.old_file, 'w') as f:
+        f.write('north = 5\nposition = 1234\n')
+    planes_state.load()
+    if planes_state.get('north') != 5 or planes_state.get('position') != 1234:
+        print('MISMATCH reading %s' % planes_state.old_file)
+
+    # A cycle every 5 seconds scaled down 100 times. Tracking for a
+    # simulated half hour and then a quiet spell
+    scale = 100.0
+    planes_state.settle /= scale
+    planes_state.max_delay /= scale
+    cycle = 5.0 / scale
+    moves = 360
+    for i in range(moves):
+        planes_state.update(north=5, position=(1234 + 7 * i) % 2038)
+        time.sleep(cycle)
+    time.sleep(planes_state.settle * 2)
+
+    with open(planes_state.state_file) as f:
+        saved = f.read()
+    if '"position": %d' % ((1234 + 7 * (moves - 1)) % 2038) not in saved:
+        print('MISMATCH after settling: %s' % saved)
+    simulated = moves * 5.0 / 3600
+    print('%d moves in %.1f simulated hours: %d writes, the original made %d (%.0f writes/hour against %.0f)' % (
+        moves, simulated, planes_state.stats['writes'], moves,
+        planes_state.stats['writes'] / simulated, moves / simulated))
+
+    write = best(lambda: planes_state.write(dict(planes_state.state)), 20, 3)
+    print('one atomic, synced write: %.2f ms' % (write / 1000))
+
+    planes_state.settle *= scale
+    planes_state.max_delay *= scale
+    shutil.rmtree(directory)
+
+
+# bench_leds shows eight aircraft flying around the device on the LED
+# ring for a simulated ten minutes, every half second tick, and counts
+# what is sent to a fake strip against the original clear, set and
+# show with the strip writing every pixel as it's set. It also checks
+# blending and the rate cap
+def bench_leds():
+    import random
+    import planes_leds
+    from planes_simgpio import FakeStrip
+
+    # The original strip was created with auto_write on, so every pixel
+    # set was sent to the strip straight away
+    class AutoWriteStrip(FakeStrip):
+        def __setitem__(self, i, colour):
+            FakeStrip.__setitem__(self, i, colour)
+            self.show()
+
+    old = AutoWriteStrip(16)
+    fake = FakeStrip(16)
+    ring = planes_leds.Ring(fake)
+    rate = planes_leds.max_rate
+    planes_leds.max_rate = 1e9
+
+    rnd = random.Random(1)
+    flights = [[rnd.uniform(0, 360), rnd.uniform(2, 40), rnd.uniform(2000, 38000),
+                rnd.uniform(-1500, 1500)] for i in range(8)]
+    north = 3
+    ticks = 10 * 60 * 2
+    for tick in range(ticks):
+        for f in flights:
+            f[0] = (f[0] + rnd.uniform(0, 0.2)) % 360
+            f[2] = max(0, f[2] + f[3] / 120)
+        aircraft = sorted([(b, int(alt // 25) * 25, d) for b, d, alt, climb in flights],
+                          key=lambda a: a[2])
+
+        for i in range(16):
+            old[i] = (0, 0, 0)
+        old[(north - int(16 * aircraft[0][0] / 360)) % 16] = planes_leds.altitude_colour(aircraft[0][1])
+        old.show()
+
+        ring.show(aircraft, north)
+        if fake.shown != ring.compose(aircraft, north):
+            print('MISMATCH at tick %d' % tick)
+
+    print('%d ticks: original %d pixels written, %d sends; ring %d pixels written, %d sends' % (
+        ticks, old.writes, old.shows, fake.writes, fake.shows))
+    print(ring.summary())
+
+    both = ring.compose([(0, 0, 1), (1, 40000, 1)], 0)
+    if both[0] != (255, 0, int(255 * planes_leds.level(1))):
+        print('MISMATCH blending %s' % (both[0],))
+
+    planes_leds.max_rate = rate
+    t = time.monotonic()
+    for i in range(5):
+        ring.light(i, (0, 0, 128))
+    print('5 changes in a row took %.0f ms at max_rate %d' % ((time.monotonic() - t) * 1000, rate))
+
+    compose = best(lambda: ring.compose(aircraft, north), 10000)
+    print('composing the ring takes %.1f us' % compose)
+
+
+benchmarks = {
+    'refdata': bench_refdata,
+    'geo': bench_geo,
+    'select': bench_select,
+    'records': bench_records,
+    'feed': bench_feed,
+    'stream': bench_stream,
+    'fusion': bench_fusion,
+    'render': bench_render,
+    'photos': bench_photos,
+    'display': bench_display,
+    'motion': bench_motion,
+    'track': bench_track,
+    'sbs': bench_sbs,
+    'metrics': bench_metrics,
+    'profile': bench_profile,
+    'startup': bench_startup,
+    'state': bench_state,
+    'leds': bench_leds,
+}
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['fakesbs']:
+        fake_sbs(*[int(a) for a in sys.argv[2:3]])
+
+    names = sys.argv[1:] or list(benchmarks)
+    for name in names:
+        if name not in benchmarks:
+            print('Unknown benchmark %s, choose from %s' % (name, ', '.join(benchmarks)))
+            sys.exit(1)
+        print('== %s' % name)
+        benchmarks[name]()
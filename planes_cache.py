@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+# A cache for the results of the aircraft and route lookups. Recently
+# used results are kept in memory (least recently used are dropped
+# first once there are too many or they take up too much space) and
+# everything is also written to an SQLite database so that the cache
+# survives a restart. Each kind of lookup has its own time to live
+
+import collections
+import sqlite3
+import threading
+import time
+
+cache_file = 'planes_cache.db'
+
+# How long results are kept for, in seconds, by kind of lookup. The
+# registration of a hex code and the route of a callsign hardly ever
+# change, photo URLs and owner details change a little more often
+
+day = 24 * 60 * 60
+
+ttls = {
+    'extra': 7 * day,
+    'reg': 30 * day,
+    'origin': 3 * day,
+    'destination': 3 * day,
+    'photo_url': 7 * day,
+}
+
+default_ttl = day
+
+# Limits on the in memory part of the cache and on the database
+
+max_entries = 2000
+max_bytes = 4 * 1024 * 1024
+max_disk_entries = 50000
+max_disk_bytes = 64 * 1024 * 1024
+
+# memory maps (kind, key) to (expires, value) with the most recently
+# used at the end. memory_bytes is the total size of the values in it
+
+memory = collections.OrderedDict()
+memory_bytes = 0
+
+# hits and misses count lookups by kind. A hit from the database
+# also counts as a disk hit
+
+hits = collections.Counter()
+disk_hits = collections.Counter()
+misses = collections.Counter()
+
+lock = threading.Lock()
+db = None
+
+
+# size returns the number of bytes value takes up in the cache
+def size(value):
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    return len(value)
+
+
+# open_db opens (creating if needed) the SQLite database. If it can't
+# be opened the cache just works in memory
+def open_db():
+    global db
+    if db is not None:
+        return db
+    try:
+        db = sqlite3.connect(cache_file, check_same_thread=False)
+        db.execute('CREATE TABLE IF NOT EXISTS cache ('
+                   'kind TEXT, key TEXT, expires REAL, used REAL, '
+                   'text INTEGER, value BLOB, size INTEGER, '
+                   'PRIMARY KEY (kind, key))')
+        db.commit()
+    except sqlite3.Error as e:
+        print("Cache database unavailable: %s" % e)
+        db = False
+    return db
+
+
+# remember puts value into the in memory cache and drops the least
+# recently used entries until it is within max_entries and max_bytes.
+# Must be called with lock held
+def remember(k, expires, value):
+    global memory_bytes
+    old = memory.pop(k, None)
+    if old is not None:
+        memory_bytes -= size(old[1])
+    memory[k] = (expires, value)
+    memory_bytes += size(value)
+    while len(memory) > max_entries or (memory_bytes > max_bytes and len(memory) > 1):
+        k, (expires, value) = memory.popitem(last=False)
+        memory_bytes -= size(value)
+
+
+# forget drops an expired entry from the in memory cache.
+# Must be called with lock held
+def forget(k):
+    global memory_bytes
+    entry = memory.pop(k)
+    memory_bytes -= size(entry[1])
+
+
+# get returns the cached value for key of the given kind or None if it
+# isn't cached or has expired
+def get(kind, key):
+    k = (kind, key)
+    now = time.time()
+    with lock:
+        entry = memory.get(k)
+        if entry is not None:
+            if entry[0] > now:
+                memory.move_to_end(k)
+                hits[kind] += 1
+                return entry[1]
+            forget(k)
+
+        d = open_db()
+        if d:
+            try:
+                row = d.execute('SELECT expires, text, value FROM cache WHERE kind = ? AND key = ?',
+                                k).fetchone()
+                if row is not None and row[0] > now:
+                    d.execute('UPDATE cache SET used = ? WHERE kind = ? AND key = ?',
+                              (now, kind, key))
+                    d.commit()
+                    value = bytes(row[2])
+                    if row[1]:
+                        value = value.decode('utf-8')
+                    remember(k, row[0], value)
+                    hits[kind] += 1
+                    disk_hits[kind] += 1
+                    return value
+            except sqlite3.Error as e:
+                print("Cache read failed: %s" % e)
+
+        misses[kind] += 1
+        return None
+
+
+# put stores value (a str or bytes) for key of the given kind
+def put(kind, key, value):
+    k = (kind, key)
+    now = time.time()
+    expires = now + ttls.get(kind, default_ttl)
+    with lock:
+        remember(k, expires, value)
+
+        d = open_db()
+        if d:
+            is_text = isinstance(value, str)
+            blob = value.encode('utf-8') if is_text else bytes(value)
+            try:
+                d.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?, ?)',
+                          (kind, key, expires, now, is_text, blob, len(blob)))
+                prune(d, now)
+                d.commit()
+            except sqlite3.Error as e:
+                print("Cache write failed: %s" % e)
+
+
+# prune deletes expired rows from the database and then the least
+# recently used ones until it is within max_disk_entries and
+# max_disk_bytes. Must be called with lock held
+def prune(d, now):
+    d.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+    count, total = d.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache').fetchone()
+    if count <= max_disk_entries and total <= max_disk_bytes:
+        return
+
+    rows = d.execute('SELECT kind, key, size FROM cache ORDER BY used').fetchall()
+    doomed = []
+    for kind, key, s in rows:
+        if count <= max_disk_entries and total <= max_disk_bytes:
+            break
+        doomed.append((kind, key))
+        count -= 1
+        total -= s
+    d.executemany('DELETE FROM cache WHERE kind = ? AND key = ?', doomed)
+
+
+# cached returns the cached value for key of the given kind, calling
+# fetch() to get it if it isn't cached. fetch should return None if the
+# lookup failed, in which case nothing is cached and None is returned
+def cached(kind, key, fetch):
+    value = get(kind, key)
+    if value is None:
+        value = fetch()
+        if value is not None:
+            put(kind, key, value)
+    return value
+
+
+# summary returns a line describing how well the cache is doing
+def summary():
+    with lock:
+        kinds = sorted(set(hits) | set(misses))
+        parts = ['%s %d/%d' % (kind, hits[kind], hits[kind] + misses[kind]) for kind in kinds]
+        return 'Cache hits %s (%d entries, %d bytes in memory)' % (
+            ', '.join(parts) or 'none', len(memory), memory_bytes)
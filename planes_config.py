@@ -1,9 +1,43 @@
 # Latitude and longitude where the device is installed.
 # DUMP1090 set to dump1090 aircraft.json location
 # FR24 set to Flightradar24 feeder flights.json location
+# SBS set to host:port of dump1090's BaseStation output
 
 MY_LAT = 0
 MY_LONG = 0
 DUMP1090 = "http://0.0.0.0/dump1090/data/aircraft.json"
 FR24 = "http://0.0.0.0:8754/flights.json"
-SOURCE = "DUMP1090" # DUMP1090 or FR24
+SBS = "0.0.0.0:30003"
+SOURCE = "DUMP1090" # DUMP1090, FR24, SBS or FUSION
+
+# With SOURCE set to FUSION all the sources in FUSION are read at the
+# same time and the aircraft they see are merged
+
+FUSION = ["DUMP1090", "FR24"]
+
+# With STREAM_FEED set to True aircraft.json is parsed as it downloads,
+# keeping only the aircraft in range. This keeps the memory used down
+# on a busy receiver
+
+STREAM_FEED = False
+
+# Aircraft further than MAX_RANGE nautical miles away or higher than
+# MAX_ALTITUDE feet are ignored (0 means no limit)
+
+MAX_RANGE = 250
+MAX_ALTITUDE = 0
+
+# DISPLAY is FBI to show the screen through fbi or FRAMEBUFFER to write
+# straight to the framebuffer device FRAMEBUFFER (which can also be an
+# ordinary file for testing)
+
+DISPLAY = "FBI"
+FRAMEBUFFER = "/dev/fb1"
+
+# With METRICS set to host:port (e.g. "127.0.0.1:9108") how long each
+# stage of a cycle takes is served there for Prometheus, and with
+# METRICS_FILE set it is also written to that file every minute. With
+# both empty nothing is timed
+
+METRICS = ""
+METRICS_FILE = ""
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+# FUNCTIONS TO SHOW IMAGES ON THE SCREEN
+#
+# There are two ways of getting an image onto the screen, chosen with
+# DISPLAY in planes_config.py:
+#
+# FBI writes the image to a PNG file that a copy of fbi running in the
+# background keeps showing. It needs no setup but every frame costs a
+# PNG encode, an mv and a pgrep.
+#
+# FRAMEBUFFER converts the image to the screen's pixel format and
+# writes it straight into the memory mapped framebuffer device
+# FRAMEBUFFER. No other programs are run. FRAMEBUFFER can also be an
+# ordinary file, which is handy for trying it out (and timing it) on
+# a machine without the screen
+
+from PIL import Image, ImageChops
+import fcntl
+import mmap
+import os
+import struct
+import subprocess
+
+from planes_config import DISPLAY, FRAMEBUFFER
+
+screen_tmp = '/tmp/planes.tmp.png'
+screen_file = '/tmp/planes.png'
+screen_links = ['/tmp/planes%d.png' % i for i in range(1, 4)]
+
+
+# fbi_show takes an image in img and writes it to a file and then
+# uses fbi to draw it to the screen
+def fbi_show(img):
+    # This is done to prevent fbi from getting an error if it tries to
+    # read one of the images it is displaying while we write it. It's
+    # written to a temporary file and then mv'ed into place.
+
+    img.save(screen_tmp)
+    subprocess.run('mv %s %s' % (screen_tmp, screen_file), shell=True)
+
+    # Determine if there are any instance of fbi running. Start one if
+    # there is not
+    running = []
+    try:
+        running = subprocess.check_output(['pgrep', 'fbi']).decode("utf-8").strip().split('\n')
+    except:
+        pass
+
+    if len(running) == 0:
+        subprocess.run('fbi -t 1 -T 2 -a -cachemem 0 -noverbose -d /dev/fb1 %s' % ' '.join(screen_links),
+                       shell=True)
+
+
+# fbi_start creates three symbolic links that are fed to fbi in
+# fbi_show. This is a trick to get fbi to cycle through images and
+# allow a single fbi instance to updated smoothly
+def fbi_start():
+    for l in screen_links:
+        subprocess.run(['ln -s %s %s' % (screen_file, l)], shell=True)
+
+
+# The size and pixel format of the framebuffer. These are asked of the
+# driver when FRAMEBUFFER is a real device, otherwise these defaults
+# (the 320x480 16 bit screen) are used
+
+fb_width = 320
+fb_height = 480
+fb_bits = 16
+fb_stride = fb_width * 2
+
+fb = None
+
+# The ioctl that reads a framebuffer's struct fb_var_screeninfo, which
+# starts xres, yres, xres_virtual, yres_virtual, xoffset, yoffset,
+# bits_per_pixel (all 32 bit) and is 160 bytes long
+
+FBIOGET_VSCREENINFO = 0x4600
+var_screeninfo = struct.Struct('=7I')
+
+
+# fb_geometry reads the size, bits per pixel and bytes per line of the
+# framebuffer device path if it can. The size is the visible one, not
+# the virtual one, which drivers that double buffer make twice as tall.
+# The bytes per line (which can include padding) come from sysfs
+def fb_geometry(path):
+    global fb_width
+    global fb_height
+    global fb_bits
+    global fb_stride
+
+    if not path.startswith('/dev/'):
+        fb_stride = fb_width * fb_bits // 8
+        return
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            info = fcntl.ioctl(fd, FBIOGET_VSCREENINFO, bytes(160))
+        finally:
+            os.close(fd)
+        fields = var_screeninfo.unpack_from(info)
+        fb_width, fb_height, fb_bits = fields[0], fields[1], fields[6]
+    except OSError as e:
+        print("Framebuffer %s size not read: %s" % (path, e))
+
+    sysfs = '/sys/class/graphics/' + os.path.basename(path)
+    try:
+        with open(sysfs + '/stride') as f:
+            fb_stride = int(f.read().strip())
+    except (OSError, ValueError):
+        fb_stride = fb_width * fb_bits // 8
+
+
+# fb_start opens and memory maps the framebuffer. An ordinary file is
+# made the right size first
+def fb_start():
+    global fb
+
+    fb_geometry(FRAMEBUFFER)
+    size = fb_stride * fb_height
+
+    if not FRAMEBUFFER.startswith('/dev/'):
+        with open(FRAMEBUFFER, 'ab') as f:
+            if f.tell() < size:
+                f.truncate(size)
+
+    fd = os.open(FRAMEBUFFER, os.O_RDWR)
+    try:
+        fb = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+    finally:
+        os.close(fd)
+
+
+# rgb565 converts img to 16 bit pixels (5 bits red, 6 green, 5 blue,
+# little endian) entirely inside PIL. The high and low bytes of every
+# pixel are built as two greyscale images and then interleaved
+def rgb565(img):
+    r, g, b = img.split()
+    hi = ImageChops.add(r.point(lambda v: v & 0xF8), g.point(lambda v: v >> 5))
+    lo = ImageChops.add(g.point(lambda v: (v & 0x1C) << 3), b.point(lambda v: v >> 3))
+    return Image.merge('LA', (lo, hi)).tobytes()
+
+
+# fb_pixels returns img as bytes in the framebuffer's format, turning it
+# round if the screen is the other way up and resizing it if needed
+def fb_pixels(img):
+    if img.size != (fb_width, fb_height):
+        if img.size == (fb_height, fb_width):
+            img = img.transpose(Image.ROTATE_90)
+        else:
+            img = img.resize((fb_width, fb_height))
+
+    if fb_bits == 16:
+        data = rgb565(img)
+    else:
+        data = img.convert('RGB').tobytes('raw', 'BGRX')
+
+    line = len(data) // fb_height
+    if line == fb_stride:
+        return data
+
+    # Lines are padded in the framebuffer
+    pad = b'\0' * (fb_stride - line)
+    return b''.join([data[y * line:(y + 1) * line] + pad for y in range(fb_height)])
+
+
+# fb_show writes img straight into the framebuffer
+def fb_show(img):
+    data = fb_pixels(img)
+    fb[0:len(data)] = data
+
+
+# screen_show shows img on the screen
+def screen_show(img):
+    if DISPLAY == "FRAMEBUFFER":
+        fb_show(img)
+    else:
+        fbi_show(img)
+
+
+# screen_start sets up the screen for use. fbcp (which copies the main
+# display to the little screen) is stopped so that it doesn't draw
+# over us
+def screen_start():
+    subprocess.run(['pkill', 'fbcp'])
+
+    if DISPLAY == "FRAMEBUFFER":
+        subprocess.run(['pkill', 'fbi'])
+        fb_start()
+    else:
+        fbi_start()
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+# Extra information about an aircraft (owner, registration, route and
+# a photo) from api.joshdouch.me. Every lookup goes through the cache
+# in planes_cache (and photos through planes_photos) so an aircraft
+# that has been seen before doesn't need any network requests, and the
+# lookups for a new aircraft are all made at the same time on a pool of
+# threads
+
+import concurrent.futures
+import json
+import queue
+import threading
+import time
+import requests
+
+import planes_cache
+import planes_http
+import planes_metrics
+import planes_photos
+from planes_geo import approaching
+from planes_refdata import airport, airline_for_flight
+
+# No single request may take longer than request_timeout seconds to
+# connect or to send data, and an aircraft's lookups are given up on
+# (and shown as unknown) after enrich_timeout seconds. Requests that
+# are still running then carry on in the background and fill the cache
+
+request_timeout = (3.05, 5)
+enrich_timeout = 10.0
+
+# The lookups needed to draw the top of the screen. The route and
+# photo are filled in when they arrive
+
+core_kinds = ['extra', 'reg']
+
+pool = concurrent.futures.ThreadPoolExecutor(max_workers=6)
+
+# The prefetcher looks up the prefetch_count aircraft after the one
+# being shown (and any that are flying towards the device) in the
+# background so that switching to one of them is instant. At most
+# prefetch_queue_size aircraft are waiting to be looked up
+
+prefetch_count = 3
+prefetch_queue_size = 8
+
+
+# fetch_text gets url and returns the body as a string, "" if the
+# server says there's no such thing (a 404) or None if the request
+# failed. Any other status, like 429 or 403 whose body is an error page,
+# counts as a failure so that it isn't cached
+def fetch_text(url):
+    try:
+        r = planes_http.get(url, timeout=request_timeout)
+    except requests.exceptions.RequestException:
+        return None
+    if r.status_code == 404:
+        return ""
+    if not 200 <= r.status_code < 300:
+        return None
+    return r.text
+
+
+# download_image gets the thumbnail URL for hexcode (through the cache)
+# and then streams the image itself into filename. It returns True if
+# it got the image, False if there is no photo of the aircraft or None
+# if a request failed
+def download_image(hexcode, filename):
+    url = "https://api.joshdouch.me/hex-image-v2-thumb.php?hex=%s" % (hexcode)
+    imgurl = planes_cache.cached('photo_url', hexcode, lambda: fetch_text(url))
+    if imgurl is None:
+        return None
+    if len(imgurl) <= 1:
+        return False
+    try:
+        with planes_http.get(imgurl, timeout=request_timeout, stream=True) as r:
+            if r.status_code == 404:
+                return False
+            if not 200 <= r.status_code < 300:
+                return None
+            with open(filename, 'wb') as f:
+                for chunk in r.iter_content(16384):
+                    f.write(chunk)
+    except requests.exceptions.RequestException:
+        return None
+    return True
+
+
+# getplaneExtraData returns a dictionary with details of the aircraft
+# (Manufacturer, Type, RegisteredOwners and so on) or an empty
+# dictionary if nothing is known
+def getplaneExtraData(hexcode):
+    url = "https://api.joshdouch.me/api/aircraft/%s" % (hexcode)
+    data = planes_cache.cached('extra', hexcode, lambda: fetch_text(url))
+    try:
+        extra = json.loads(data)
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(extra, dict):
+        return {}
+    return extra
+
+
+# getplaneReg returns the registration of the aircraft
+def getplaneReg(hexcode):
+    url = "https://api.joshdouch.me/hex-reg.php?hex=%s" % (hexcode)
+    return planes_cache.cached('reg', hexcode, lambda: fetch_text(url)) or ""
+
+
+# getplaneRoutetoData returns the ICAO code of the airport the flight
+# is going to
+def getplaneRoutetoData(callsign):
+    url = "https://api.joshdouch.me/callsign-des_ICAO.php?callsign=%s" % (callsign)
+    return planes_cache.cached('destination', callsign, lambda: fetch_text(url)) or ""
+
+
+# getplaneRoutefromData returns the ICAO code of the airport the
+# flight came from
+def getplaneRoutefromData(callsign):
+    url = "https://api.joshdouch.me/callsign-origin_ICAO.php?callsign=%s" % (callsign)
+    return planes_cache.cached('origin', callsign, lambda: fetch_text(url)) or ""
+
+
+# getplaneImg returns a photo of the aircraft, already resized for the
+# screen, as a PIL image or False if there isn't one
+def getplaneImg(hexcode):
+    img = planes_photos.photo(hexcode, lambda filename: download_image(hexcode, filename))
+    if not img:
+        return False
+    return img
+
+
+# lookup returns fn(key), timing it as the enrich_<kind> stage
+def lookup(kind, fn, key):
+    with planes_metrics.timed('enrich_' + kind):
+        return fn(key)
+
+
+# Enrichment runs all the lookups for one aircraft on the pool and
+# keeps track of which results have arrived. If notify is given it is
+# called (from the pool) each time a result arrives
+class Enrichment:
+    def __init__(self, hexcode, flight, notify=None):
+        self.hexcode = hexcode
+        self.flight = flight
+        self.deadline = time.monotonic() + enrich_timeout
+        self.futures = {
+            'extra': pool.submit(lookup, 'extra', getplaneExtraData, hexcode),
+            'reg': pool.submit(lookup, 'reg', getplaneReg, hexcode),
+            'image': pool.submit(lookup, 'image', getplaneImg, hexcode),
+        }
+        if flight != '':
+            self.futures['origin'] = pool.submit(lookup, 'origin', getplaneRoutefromData, flight)
+            self.futures['destination'] = pool.submit(lookup, 'destination', getplaneRoutetoData,
+                                                      flight)
+        self.shown = set()
+        if notify is not None:
+            for f in self.futures.values():
+                f.add_done_callback(lambda f: notify())
+
+    # cancel cancels the lookups that haven't started yet, for when
+    # another aircraft is tracked before they get their turn on the pool
+    def cancel(self):
+        for f in self.futures.values():
+            f.cancel()
+
+    # done returns the set of lookups that have finished. After the
+    # deadline everything counts as finished
+    def done(self):
+        if time.monotonic() >= self.deadline:
+            return set(self.futures)
+        return set([kind for kind in self.futures if self.futures[kind].done()])
+
+    # wait waits until the lookups in kinds have finished or timeout
+    # seconds have passed, whichever is first (and never past the
+    # deadline)
+    def wait(self, kinds, timeout):
+        timeout = min(timeout, self.deadline - time.monotonic())
+        if timeout > 0:
+            concurrent.futures.wait([self.futures[k] for k in kinds if k in self.futures],
+                                    timeout=timeout)
+
+    # changed returns True if any lookups have finished since the last
+    # call to details
+    def changed(self):
+        return self.done() != self.shown
+
+    # result returns the result of the kind lookup, or default if it
+    # hasn't finished
+    def result(self, kind, default):
+        f = self.futures.get(kind)
+        if f is None or not f.done():
+            return default
+        try:
+            return f.result()
+        except Exception as e:
+            print("Lookup %s for %s failed: %s" % (kind, self.hexcode, e))
+            return default
+
+    # details returns the information found so far ready for spotted()
+    # as a dictionary. Anything that isn't known is empty
+    def details(self):
+        self.shown = self.done()
+
+        info = {'flight': self.flight, 'planemake': '', 'planetype': '', 'airline': '',
+                'reg': self.result('reg', ''), 'photo': self.result('image', False),
+                'from_airport': '', 'from_city': '', 'from_country': '',
+                'to_airport': '', 'to_city': '', 'to_country': ''}
+
+        extra = self.result('extra', {})
+        if 'ModeS' in extra:
+            info['planemake'] = extra.get('Manufacturer', '')
+            info['planetype'] = extra.get('Type', '')
+            info['airline'] = extra.get('RegisteredOwners', '')
+
+        if self.flight == '':
+            return info
+
+        if info['airline'] == '':
+            operator = airline_for_flight(self.flight)
+            if operator is not None:
+                info['airline'] = operator[1]
+
+        origin = self.result('origin', None)
+        if origin is not None:
+            from_ = airport(origin[:4])
+            info['from_airport'] = from_[1]
+            info['from_city'] = from_[2]
+            info['from_country'] = from_[3]
+
+        destination = self.result('destination', None)
+        if destination is not None:
+            to_ = airport(destination[:4])
+            info['to_airport'] = to_[1]
+            info['to_city'] = to_[2]
+            info['to_country'] = to_[3]
+
+        return info
+
+
+# wanted is the set of hex codes the prefetcher should still look up,
+# anything else in the queue has left range and is skipped. prefetched
+# holds the aircraft already looked up (or queued) while they stay wanted
+
+prefetch_queue = queue.Queue(maxsize=prefetch_queue_size)
+wanted = set()
+prefetched = set()
+prefetch_thread = None
+
+
+# prefetch_worker looks up the aircraft in prefetch_queue one at a time
+# through the cache, giving up on any that are no longer wanted
+def prefetch_worker():
+    while True:
+        hexcode, flight = prefetch_queue.get()
+        lookups = [lambda: getplaneExtraData(hexcode),
+                   lambda: getplaneReg(hexcode),
+                   lambda: getplaneImg(hexcode)]
+        if flight != '':
+            lookups.append(lambda: getplaneRoutefromData(flight))
+            lookups.append(lambda: getplaneRoutetoData(flight))
+        for lookup in lookups:
+            if hexcode not in wanted:
+                break
+            try:
+                lookup()
+            except Exception as e:
+                print("Prefetch for %s failed: %s" % (hexcode, e))
+
+
+# prefetch queues the aircraft worth looking up ahead of time given the
+# near list (nearest first, with bearings) and the index of the one
+# being shown
+def prefetch(near, bearings, shown):
+    global wanted
+    global prefetch_thread
+
+    picked = list(range(shown + 1, min(len(near), shown + 1 + prefetch_count)))
+    for j in range(len(near)):
+        if j != shown and j not in picked:
+            if approaching(near[j].track, bearings[j]):
+                picked.append(j)
+    candidates = [near[j] for j in picked]
+
+    wanted = set([ac.hex for ac in candidates])
+    prefetched.intersection_update(wanted)
+
+    if prefetch_thread is None:
+        prefetch_thread = threading.Thread(target=prefetch_worker, daemon=True)
+        prefetch_thread.start()
+
+    for ac in candidates:
+        if ac.hex in prefetched:
+            continue
+        try:
+            prefetch_queue.put_nowait((ac.hex, ac.flight))
+        except queue.Full:
+            break
+        prefetched.add(ac.hex)
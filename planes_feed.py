@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+# Reads the list of aircraft from dump1090 or the FR24 feeder. The feed
+# is polled with conditional requests so that if it hasn't changed
+# since the last poll nothing is downloaded, and dump1090's now and
+# messages fields are checked before parsing so that an unchanged
+# aircraft.json isn't parsed again
+#
+# With STREAM_FEED set aircraft.json is parsed as it downloads, one
+# aircraft at a time, and only the aircraft that could be shown are
+# kept, so a busy receiver's feed never has to be held in memory whole
+#
+# With SOURCE set to SBS nothing is polled at all, the aircraft come
+# from the table that planes_sbs keeps up to date from dump1090's
+# BaseStation stream. With SOURCE set to FUSION the sources listed in
+# FUSION are all read at once and merged by planes_fusion
+
+import codecs
+import json
+import re
+import time
+import requests
+
+import planes_fusion
+import planes_http
+import planes_sbs
+from planes_aircraft import records, from_dict, from_fr24
+from planes_config import DUMP1090, FR24, SOURCE, STREAM_FEED, FUSION
+from planes_select import usable
+
+# feeds maps each url polled to its Feed (below)
+
+feeds = {}
+
+# dump1090 writes now (the time the file was written) and messages
+# (the number of messages received) at the start of aircraft.json. If
+# both are the same the file hasn't changed
+
+now_re = re.compile(rb'"now"\s*:\s*([0-9.]+)')
+messages_re = re.compile(rb'"messages"\s*:\s*([0-9]+)')
+aircraft_re = re.compile(r'"aircraft"\s*:\s*\[')
+separator_re = re.compile(r'[\s,]*')
+
+# Counters used to report how much work the conditional polling saves.
+# parse_time and parse_saved are in seconds of CPU time
+
+stats = {
+    'polls': 0,
+    'not_modified': 0,
+    'unchanged': 0,
+    'bytes': 0,
+    'bytes_saved': 0,
+    'parse_time': 0.0,
+    'parse_saved': 0.0,
+}
+started = time.monotonic()
+reported = started
+
+# How often, in seconds, getplanes prints the report
+
+report_interval = 60 * 60
+
+# When streaming, aircraft.json is read chunk_size bytes at a time
+
+chunk_size = 16384
+
+
+# feed_key returns the (now, messages) at the start of a dump1090
+# aircraft.json body or None if they can't be found
+def feed_key(body):
+    head = body[:256]
+    now = now_re.search(head)
+    messages = messages_re.search(head)
+    if now is None or messages is None:
+        return None
+    return now.group(1), messages.group(1)
+
+
+# parse_dump1090 returns the aircraft list from a dump1090 aircraft.json
+def parse_dump1090(body):
+    j = json.loads(body)
+    if j['aircraft'] is None:
+        return ""
+    return records(j['aircraft'], from_dict)
+
+
+# parse_fr24 returns the aircraft list from an FR24 feeder flights.json
+def parse_fr24(body):
+    j = json.loads(body)
+    if not isinstance(j, dict):
+        raise ValueError('flights.json is not an object')
+    return records(j.values(), from_fr24)
+
+
+# parse_stream returns the aircraft list from a dump1090 aircraft.json
+# that arrives as chunks of bytes. Each entry in the aircraft array is
+# decoded on its own as soon as it has all arrived and is only kept if
+# planes_select.usable would pick it, so the memory used doesn't grow
+# with the size of the feed
+def parse_stream(chunks):
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    started = False
+    planes = []
+
+    for chunk in chunks:
+        buf = buf[pos:] + text.decode(chunk)
+        pos = 0
+
+        if not started:
+            # Find the start of the aircraft array
+            m = aircraft_re.search(buf)
+            if m is None:
+                continue
+            pos = m.end()
+            started = True
+
+        while True:
+            pos = separator_re.match(buf, pos).end()
+            if pos == len(buf):
+                break
+            if buf[pos] == ']':
+                return planes
+            try:
+                d, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # The rest of this entry is in the next chunk
+                break
+            pos = end
+            ac = from_dict(d)
+            if ac is not None and usable(ac):
+                planes.append(ac)
+
+    raise ValueError('aircraft.json ended early')
+
+
+# Feed polls one url. It keeps the headers needed to make the next
+# request conditional, the size of the last body received, how long it
+# took to parse and the aircraft list parsed from it
+class Feed:
+    def __init__(self, url):
+        self.url = url
+        self.etag = None
+        self.last_modified = None
+        self.last_key = None
+        self.last_size = 0
+        self.last_parse = 0.0
+        self.last_planes = ""
+
+    # fetch gets the url using the ETag and Last-Modified from the
+    # previous poll. It returns the response, or None if the feed hasn't
+    # changed (a 304 response). If stream is True the body is left to be
+    # read from the response. Raises requests exceptions on failure
+    def fetch(self, stream=False):
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+
+        r = planes_http.get(self.url, headers=headers, stream=stream)
+        stats['polls'] += 1
+        if r.status_code == 304:
+            r.close()
+            stats['not_modified'] += 1
+            return None
+        if not r.ok:
+            r.close()
+        r.raise_for_status()
+
+        self.etag = r.headers.get('ETag')
+        self.last_modified = r.headers.get('Last-Modified')
+        return r
+
+    # parse turns body into the aircraft list with parser, keeping track
+    # of how much CPU time it took
+    def parse(self, body, parser):
+        t = time.thread_time()
+        planes = parser(body)
+        self.last_parse = time.thread_time() - t
+        stats['parse_time'] += self.last_parse
+        return planes
+
+    # counted yields head and then the rest of chunks, adding their sizes
+    # to the bytes downloaded
+    def counted(self, head, chunks):
+        self.last_size = len(head)
+        stats['bytes'] += len(head)
+        yield head
+        for chunk in chunks:
+            self.last_size += len(chunk)
+            stats['bytes'] += len(chunk)
+            yield chunk
+
+    # poll fetches the url and parses it with parser unless it is
+    # unchanged since the last poll, in which case the last aircraft list
+    # is returned again. Returns "" if the feed can't be read. If stream
+    # is True the body is parsed with parse_stream as it downloads
+    # instead, and the download stops after the first chunk if it's
+    # unchanged. If the body can't be read or parsed the ETag,
+    # Last-Modified and key are forgotten, otherwise every poll after
+    # would be told it's unchanged and get the failed "" again
+    def poll(self, parser, keyed, stream=False):
+        try:
+            r = self.fetch(stream)
+        except requests.exceptions.RequestException:
+            self.last_planes = ""
+            return ""
+
+        if r is None:
+            stats['bytes_saved'] += self.last_size
+            stats['parse_saved'] += self.last_parse
+            return self.last_planes
+
+        try:
+            if stream:
+                chunks = r.iter_content(chunk_size)
+                body = next(chunks, b'')
+            else:
+                body = r.content
+                stats['bytes'] += len(body)
+                self.last_size = len(body)
+
+            key = feed_key(body) if keyed else None
+            if key is not None and key == self.last_key and self.last_planes != "":
+                stats['unchanged'] += 1
+                stats['parse_saved'] += self.last_parse
+                if stream:
+                    size = int(r.headers.get('Content-Length', len(body)))
+                    stats['bytes'] += len(body)
+                    stats['bytes_saved'] += size - len(body)
+                return self.last_planes
+            self.last_key = key
+
+            if stream:
+                self.last_planes = self.parse(self.counted(body, chunks), parse_stream)
+            else:
+                self.last_planes = self.parse(body, parser)
+        except (requests.exceptions.RequestException, ValueError, KeyError, IndexError, TypeError):
+            self.last_planes = ""
+            self.etag = None
+            self.last_modified = None
+            self.last_key = None
+        finally:
+            r.close()
+        return self.last_planes
+
+
+# poll polls url with the Feed kept for it (see Feed.poll)
+def poll(url, parser, keyed, stream=False):
+    feed = feeds.get(url)
+    if feed is None:
+        feed = Feed(url)
+        feeds[url] = feed
+    return feed.poll(parser, keyed, stream)
+
+
+# report returns a line describing how much downloading and parsing the
+# conditional polling has saved, per hour
+def report():
+    hours = max(time.monotonic() - started, 1) / 3600
+    return ('Feed: %d polls, %d not modified, %d unchanged, '
+            'saved %.0f KB/hour and %.1f CPU seconds/hour (downloaded %.0f KB/hour)' % (
+                stats['polls'], stats['not_modified'], stats['unchanged'],
+                stats['bytes_saved'] / 1024 / hours, stats['parse_saved'] / hours,
+                stats['bytes'] / 1024 / hours))
+
+
+# read reads the list of planes from the source called name (DUMP1090,
+# FR24 or SBS)
+def read(name):
+    if name == "DUMP1090":
+        return poll(DUMP1090, parse_dump1090, True, STREAM_FEED)
+    elif name == "FR24":
+        return poll(FR24, parse_fr24, False)
+    elif name == "SBS":
+        return planes_sbs.getplanes()
+    return ""
+
+
+# getplanes calls the Dump1090 or FR24 API (or reads the SBS table, or
+# merges several of them) to get the list of planes.
+# It returns a list of planes_aircraft.Aircraft, one per aircraft, or ""
+# if the list couldn't be read
+def getplanes():
+    global reported
+
+    if SOURCE == "FUSION":
+        planes = planes_fusion.getplanes()
+    else:
+        planes = read(SOURCE)
+
+    if time.monotonic() - reported >= report_interval:
+        reported = time.monotonic()
+        if SOURCE == "FUSION":
+            print(planes_fusion.report())
+        if SOURCE == "SBS" or (SOURCE == "FUSION" and "SBS" in FUSION):
+            print(planes_sbs.report())
+        if SOURCE != "SBS":
+            print(report())
+
+    return planes
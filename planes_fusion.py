@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# Reads several sources at once and merges what they see. Each source
+# in FUSION (DUMP1090, FR24 or SBS) is read in its own thread and the
+# aircraft are merged by hex code, keeping whichever source has the
+# newest position for each one. A source that is slow to answer doesn't
+# hold up the others: after wait_timeout seconds the sources that have
+# answered are merged with the last answer from the ones that haven't,
+# and the slow ones carry on in the background until their next turn.
+# A source that was late isn't waited for at all until it answers in
+# time again, its last answer is used instead
+#
+# Every source is counted separately: how long it takes to answer, how
+# often it was too late, how many of the merged aircraft came from it
+# and how many of those no other source had
+
+import concurrent.futures
+import threading
+import time
+
+import planes_feed
+from planes_config import FUSION
+
+# How long to wait for the sources each time, and how old (in seconds)
+# the last answer from a source can be and still be used
+
+wait_timeout = 1.0
+max_age = 30.0
+
+pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(FUSION)))
+
+# pending maps a source to the read that is still running for it and
+# latest maps it to (time, planes) for its last answer, on the
+# monotonic clock
+
+pending = {}
+latest = {}
+lock = threading.Lock()
+
+# late is the set of sources that hadn't answered by the end of the
+# last getplanes
+
+late = set()
+
+stats = {}
+for name in FUSION:
+    stats[name] = {
+        'reads': 0,
+        'failed': 0,
+        'late': 0,
+        'time': 0.0,
+        'max_time': 0.0,
+        'used': 0,
+        'only': 0,
+    }
+
+
+# timed reads the source name and keeps track of how long it took. It
+# returns when the read finished and the planes
+def timed(name):
+    t = time.monotonic()
+    planes = planes_feed.read(name)
+    took = time.monotonic() - t
+
+    s = stats[name]
+    with lock:
+        s['reads'] += 1
+        s['time'] += took
+        s['max_time'] = max(s['max_time'], took)
+        if planes == "":
+            s['failed'] += 1
+    return time.monotonic(), planes
+
+
+# collect takes the answer from the finished read of the source name
+def collect(name):
+    t, planes = pending.pop(name).result()
+    if planes == "":
+        latest.pop(name, None)
+    else:
+        latest[name] = (t, planes)
+
+
+# merge returns one list of aircraft from answers, a list of (source
+# name, planes, age in seconds). Where more than one source has an
+# aircraft the one with the newest position is kept. Positions from an
+# older answer are made older by its age so they compare fairly
+def merge(answers):
+    best = {}
+    seen_by = {}
+    for name, planes, age in answers:
+        for ac in planes:
+            seen_by[ac.hex] = seen_by.get(ac.hex, 0) + 1
+            current = best.get(ac.hex)
+            if current is None or ac.seen + age < current[2]:
+                best[ac.hex] = (name, ac, ac.seen + age)
+
+    merged = []
+    for hexcode, (name, ac, seen) in best.items():
+        stats[name]['used'] += 1
+        if seen_by[hexcode] == 1:
+            stats[name]['only'] += 1
+        if seen != ac.seen:
+            ac = ac.aged(seen - ac.seen)
+        merged.append(ac)
+    return merged
+
+
+# getplanes reads all the sources in FUSION and returns the merged list
+# of aircraft, or "" if none of them could be read
+def getplanes():
+    # A read that was late last time may have finished since, in which
+    # case its answer is kept and a new read started
+    for name in FUSION:
+        if name in pending and pending[name].done():
+            collect(name)
+        if name not in pending:
+            pending[name] = pool.submit(timed, name)
+
+    waiting = [pending[name] for name in FUSION if name not in late]
+    if len(waiting) > 0:
+        concurrent.futures.wait(waiting, timeout=wait_timeout)
+
+    for name in FUSION:
+        if pending[name].done():
+            collect(name)
+            late.discard(name)
+        else:
+            stats[name]['late'] += 1
+            late.add(name)
+
+    now = time.monotonic()
+
+    answers = []
+    for name in FUSION:
+        if name in latest:
+            t, planes = latest[name]
+            if now - t <= max_age:
+                answers.append((name, planes, now - t))
+    if len(answers) == 0:
+        return ""
+    return merge(answers)
+
+
+# report returns a line for each source describing how it's doing
+def report():
+    lines = []
+    for name in FUSION:
+        s = stats[name]
+        reads = max(s['reads'], 1)
+        lines.append('Fusion %s: %d reads, %d failed, %d late, %.0f ms average, %.0f ms worst, '
+                     '%d aircraft used, %d seen only by it' % (
+                         name, s['reads'], s['failed'], s['late'], 1000 * s['time'] / reads,
+                         1000 * s['max_time'], s['used'], s['only']))
+    return '\n'.join(lines)
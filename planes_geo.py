@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# Distance and bearing from the device to aircraft. A whole poll's
+# worth of aircraft is handled in one go using NumPy when it is
+# installed, otherwise it falls back to one haversine call per aircraft
+
+import heapq
+import math
+import haversine
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from planes_config import MY_LAT, MY_LONG
+
+# The earth radius haversine uses for nautical miles, worked out from
+# the library itself so the NumPy version gives the same answers
+# whatever version of haversine is installed
+
+earth_radius = haversine.haversine((0, 0), (0, 1), unit=haversine.Unit.NAUTICAL_MILES) / math.radians(1)
+
+
+# distance returns the distance to an aircraft
+def distance(a):
+    return haversine.haversine((MY_LAT, MY_LONG), (a.lat, a.lon), unit=haversine.Unit.NAUTICAL_MILES)
+
+
+# bearing works out the bearing of one lat/long from another
+def bearing(la1, lo1, la2, lo2):
+    lat1 = math.radians(la1)
+    lat2 = math.radians(la2)
+
+    diff = math.radians(lo2 - lo1)
+
+    x = math.sin(diff) * math.cos(lat2)
+    y = math.cos(lat1) * math.sin(lat2) - (math.sin(lat1)
+                                           * math.cos(lat2) * math.cos(diff))
+
+    b = math.degrees(math.atan2(x, y))
+    return (b + 360) % 360
+
+
+# batch_python is the pure Python version of batch, one haversine and
+# one bearing call per aircraft
+def batch_python(lats, lons, k=None):
+    dists = [haversine.haversine((MY_LAT, MY_LONG), (la, lo), unit=haversine.Unit.NAUTICAL_MILES)
+             for la, lo in zip(lats, lons)]
+    bearings = [bearing(MY_LAT, MY_LONG, la, lo) for la, lo in zip(lats, lons)]
+    if k is None:
+        order = sorted(range(len(dists)), key=dists.__getitem__)
+    else:
+        order = heapq.nsmallest(k, range(len(dists)), key=dists.__getitem__)
+    return dists, bearings, order
+
+
+# batch_numpy is the NumPy version of batch. It's the same haversine
+# and bearing formulas as above applied to whole arrays at once
+def batch_numpy(lats, lons, k=None):
+    lat1 = math.radians(MY_LAT)
+    lon1 = math.radians(MY_LONG)
+    lat2 = numpy.radians(numpy.asarray(lats, dtype=float))
+    lon2 = numpy.radians(numpy.asarray(lons, dtype=float))
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    cos_lat2 = numpy.cos(lat2)
+
+    h = numpy.sin(dlat * 0.5) ** 2 + math.cos(lat1) * cos_lat2 * numpy.sin(dlon * 0.5) ** 2
+    dists = 2 * earth_radius * numpy.arcsin(numpy.sqrt(h))
+
+    x = numpy.sin(dlon) * cos_lat2
+    y = math.cos(lat1) * numpy.sin(lat2) - math.sin(lat1) * cos_lat2 * numpy.cos(dlon)
+    bearings = (numpy.degrees(numpy.arctan2(x, y)) + 360) % 360
+
+    # Only the k nearest need to be put in order so partition first
+    # and sort just those
+    n = len(dists)
+    if k is not None and k < n:
+        part = numpy.argpartition(dists, k)[:k]
+        order = part[numpy.argsort(dists[part], kind='stable')]
+    else:
+        order = numpy.argsort(dists, kind='stable')
+
+    return dists.tolist(), bearings.tolist(), order.tolist()
+
+
+# batch works out the distance (in nautical miles) and bearing (in
+# degrees) from the device to every aircraft whose positions are in
+# the lists lats and lons. It returns three lists: the distances, the
+# bearings and the indices of the k nearest aircraft, nearest first
+# (all of them if k is None)
+def batch(lats, lons, k=None):
+    if numpy is None or len(lats) == 0:
+        return batch_python(lats, lons, k)
+    return batch_numpy(lats, lons, k)
+
+
+# approaching returns True if an aircraft with the given track that is
+# at bearing b from the device is flying towards the device, give or
+# take within degrees
+def approaching(track, b, within=30):
+    diff = (track - (b + 180)) % 360
+    return min(diff, 360 - diff) <= within
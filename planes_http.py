@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+# A single HTTP session shared by everything that talks to the network
+# so that connections to dump1090, the FR24 feeder and the enrichment
+# API are kept open and reused instead of opened for every request
+
+import requests
+import requests.adapters
+
+# Requests give up if connecting or waiting for data takes longer than
+# timeout seconds (connect, read)
+
+timeout = (3.05, 5)
+
+# Connections are pooled per host. pool_size needs to be at least the
+# number of threads in planes_enrich.pool
+
+pool_hosts = 4
+pool_size = 8
+
+session = requests.Session()
+adapter = requests.adapters.HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size)
+session.mount('http://', adapter)
+session.mount('https://', adapter)
+
+
+# get is requests.get on the shared session with a timeout
+def get(url, **kwargs):
+    kwargs.setdefault('timeout', timeout)
+    return session.get(url, **kwargs)
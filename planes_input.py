@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+# FUNCTIONS TO READ THE BLUE PUSH BUTTON
+#
+# The button is read with GPIO edge callbacks rather than by polling
+# it. Each edge is debounced by waiting for the level to settle, then
+# a release turns into a 'short' event and holding the button down
+# for long_press seconds turns into a 'long' event. Events go into a
+# queue that the main loop waits on, and other parts of the program can
+# post their own events (planes.py posts 'enriched' when details of
+# the tracked aircraft arrive) so that the main loop only ever has to
+# wait in one place
+
+import queue
+import threading
+
+BUTTON_PIN = 23
+
+# An edge only counts once the level has stayed the same for debounce
+# seconds. Holding the button for long_press seconds starts calibration
+
+debounce = 0.03
+long_press = 5.0
+
+events = queue.Queue()
+
+gpio = None
+lock = threading.Lock()
+
+# held is set while the button is down. long_sent is True once the
+# current press has sent a 'long' event so the release doesn't also
+# send a 'short' one
+
+held = threading.Event()
+long_sent = False
+settle_timer = None
+long_timer = None
+
+
+# start sets up the button on gpio (RPi.GPIO or planes_simgpio) and
+# starts listening for presses
+def start(g):
+    global gpio
+    gpio = g
+    gpio.setup(BUTTON_PIN, gpio.IN, pull_up_down=gpio.PUD_DOWN)
+    if gpio.input(BUTTON_PIN) == gpio.HIGH:
+        held.set()
+    gpio.add_event_detect(BUTTON_PIN, gpio.BOTH, callback=edge)
+
+
+# edge is called by GPIO on every change of the button. Bounces cause
+# several of these in quick succession so the level is only read once
+# they have stopped
+def edge(pin):
+    global settle_timer
+    with lock:
+        if settle_timer is not None:
+            settle_timer.cancel()
+        settle_timer = threading.Timer(debounce, settle)
+        settle_timer.daemon = True
+        settle_timer.start()
+
+
+# settle reads the level of the button once it has stopped bouncing and
+# works out whether it has been pressed or released
+def settle():
+    global long_sent
+    global long_timer
+
+    down = gpio.input(BUTTON_PIN) == gpio.HIGH
+    with lock:
+        if down == held.is_set():
+            return
+
+        if down:
+            held.set()
+            long_sent = False
+            long_timer = threading.Timer(long_press, long_held)
+            long_timer.daemon = True
+            long_timer.start()
+        else:
+            held.clear()
+            if long_timer is not None:
+                long_timer.cancel()
+                long_timer = None
+            if not long_sent:
+                post('short')
+
+
+# long_held is called long_press seconds after the button went down
+def long_held():
+    global long_sent
+    with lock:
+        if held.is_set() and not long_sent:
+            long_sent = True
+            post('long')
+
+
+# post adds event to the queue the main loop waits on. It can be called
+# from any thread
+def post(event):
+    events.put(event)
+
+
+# next_event waits for at most timeout seconds for an event and returns
+# it, or None if there wasn't one
+def next_event(timeout):
+    try:
+        if timeout <= 0:
+            return events.get_nowait()
+        return events.get(timeout=timeout)
+    except queue.Empty:
+        return None
+
+
+# clear_events throws away any events waiting in the queue, used after
+# calibration where the presses have already been dealt with
+def clear_events():
+    while next_event(0) is not None:
+        pass
+
+
+# button_wait waits until the button is pressed
+def button_wait():
+    held.wait()
+
+
+# button_held returns True if the button is down, waiting up to timeout
+# seconds for it to be pressed
+def button_held(timeout):
+    return held.wait(max(0, timeout))
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+# FUNCTIONS FOR THE CIRCULAR STRIP OF LEDS THAT INDICATE DIRECTION TO
+# THE AIRCRAFT
+#
+# The ring shows the aircraft_count nearest aircraft at once, each on
+# the LED pointing towards it in a colour that shows its altitude. The
+# tracked aircraft is at full brightness and the others are dimmer the
+# further away they are. Aircraft that fall on the same LED have their
+# colours added together.
+#
+# The whole ring is worked out as a list of pixels and only sent to the
+# strip when it differs from what the strip is already showing, and
+# then no more than max_rate times a second. The strip is passed in
+# (created with auto_write=False) so that planes_simgpio.FakeStrip can
+# be used to try this out without the hardware.
+
+import time
+
+# The number of aircraft shown, how bright (0 to 1) the others are at
+# their brightest and dimmest, and the distance in nautical miles at
+# which they are dimmest
+
+aircraft_count = 4
+others_level = 0.5
+min_level = 0.1
+fade_distance = 30.0
+
+max_rate = 20
+
+off = (0, 0, 0)
+
+
+# altitude_colour returns a colour for the strip LEDs depending on the
+# altitude
+def altitude_colour(alt):
+    # Input a value 0 to 255 to get a color value.
+    # The colours are a transition r - g - b - back to r.
+
+    pos = int(alt / 100)
+    if pos > 340:
+        pos = 340
+    elif pos < 0:
+        pos = 0
+    if pos < 85:
+        r = 255
+        g = int(pos * 3)
+        b = 0
+    elif pos < 170:
+        pos -= 85
+        r = int(255 - pos * 3)
+        g = 255
+        b = 0
+    elif pos < 255:
+        pos -= 170
+        r = 0
+        g = 255
+        b = int(pos * 3)
+    else:
+        pos -= 255
+        r = 0
+        g = int(255 - pos * 3)
+        b = 255
+    return r, g, b
+
+
+# level returns how bright (0 to 1) an aircraft that isn't tracked is
+# shown at distance dist
+def level(dist):
+    fade = max(0.0, min(1.0, dist / fade_distance))
+    return others_level - (others_level - min_level) * fade
+
+
+# Ring keeps what the LEDs on strip are showing and only sends changes
+class Ring:
+    def __init__(self, strip):
+        self.strip = strip
+        self.count = len(strip)
+        self.shown = None
+        self.last = 0.0
+        self.stats = {
+            'frames': 0,
+            'shown': 0,
+            'unchanged': 0,
+            'capped': 0,
+            'pixels': 0,
+        }
+
+    # led returns the LED that points towards bearing degrees when LED
+    # north points north
+    def led(self, north, bearing):
+        return (north - int(self.count * bearing / 360)) % self.count
+
+    # compose returns the pixels showing aircraft, a list of (bearing,
+    # altitude, distance) with the tracked aircraft first
+    def compose(self, aircraft, north):
+        pixels = [off] * self.count
+        for n, (bearing, altitude, dist) in enumerate(aircraft[:aircraft_count]):
+            colour = altitude_colour(altitude)
+            if n > 0:
+                brightness = level(dist)
+                colour = (int(colour[0] * brightness), int(colour[1] * brightness),
+                          int(colour[2] * brightness))
+            i = self.led(north, bearing)
+            p = pixels[i]
+            pixels[i] = (min(255, p[0] + colour[0]), min(255, p[1] + colour[1]),
+                         min(255, p[2] + colour[2]))
+        return pixels
+
+    # show shows aircraft (as for compose) on the ring
+    def show(self, aircraft, north):
+        self.update(self.compose(aircraft, north))
+
+    # light shows colour on LED i with the rest off
+    def light(self, i, colour):
+        pixels = [off] * self.count
+        pixels[i % self.count] = colour
+        self.update(pixels)
+
+    # clear turns off every LED
+    def clear(self):
+        self.update([off] * self.count)
+
+    # update sends pixels to the strip if they differ from what it's
+    # showing, waiting if the last update was less than 1/max_rate
+    # seconds ago. It returns True if the strip was updated
+    def update(self, pixels):
+        self.stats['frames'] += 1
+        if pixels == self.shown:
+            self.stats['unchanged'] += 1
+            return False
+
+        wait = self.last + 1.0 / max_rate - time.monotonic()
+        if wait > 0:
+            self.stats['capped'] += 1
+            time.sleep(wait)
+
+        for i in range(self.count):
+            if self.shown is None or pixels[i] != self.shown[i]:
+                self.strip[i] = pixels[i]
+                self.stats['pixels'] += 1
+        self.strip.show()
+        self.shown = list(pixels)
+        self.last = time.monotonic()
+        self.stats['shown'] += 1
+        return True
+
+    # summary returns a line describing how many updates were sent to
+    # the strip
+    def summary(self):
+        s = self.stats
+        return 'LEDs: %d frames, %d sent to the strip (%d pixels), %d unchanged, %d held back' % (
+            s['frames'], s['shown'], s['pixels'], s['unchanged'], s['capped'])
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+# Times the stages of each cycle (reading the feed, picking the nearest
+# aircraft, each lookup, drawing the screen, showing it, turning the
+# model aircraft and updating the LEDs) and keeps counters, so that it
+# can be seen where the time goes. The last window timings of each
+# stage are kept and their 50th, 95th and 99th percentiles worked out
+# when asked for.
+#
+# Everything is served in Prometheus text format over HTTP at METRICS
+# (host:port) and written to METRICS_FILE every file_interval seconds.
+# With neither set nothing is timed and the calls cost next to nothing
+
+import collections
+import contextlib
+import os
+import threading
+import time
+
+from planes_config import METRICS, METRICS_FILE
+
+enabled = bool(METRICS or METRICS_FILE)
+
+# The number of timings kept for each stage, the percentiles worked out
+# from them and how often (in seconds) METRICS_FILE is written
+
+window = 1000
+quantiles = [0.5, 0.95, 0.99]
+file_interval = 60
+
+prefix = 'aeronear'
+
+# stages maps a stage name to a Stage, counters maps a counter name to
+# its count and sources maps a name to a dict of counters kept by
+# another module (like planes_feed.stats) which are included as they are
+
+stages = {}
+counters = collections.Counter()
+sources = {}
+lock = threading.Lock()
+
+# idle is what timed returns when nothing is being timed
+
+idle = contextlib.nullcontext()
+
+started = False
+server = None
+
+
+# Stage keeps the last window timings of a stage (in seconds) along
+# with how many there have been and their total
+class Stage:
+    def __init__(self):
+        self.recent = collections.deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    # percentiles returns the quantiles of the recent timings
+    def percentiles(self):
+        recent = sorted(self.recent)
+        if len(recent) == 0:
+            return [0.0 for q in quantiles]
+        return [recent[min(len(recent) - 1, int(q * len(recent)))] for q in quantiles]
+
+
+# Timer times the code inside a with statement as the stage name
+class Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# observe adds a timing of seconds for the stage name
+def observe(name, seconds):
+    with lock:
+        stage = stages.get(name)
+        if stage is None:
+            stage = Stage()
+            stages[name] = stage
+        stage.recent.append(seconds)
+        stage.count += 1
+        stage.total += seconds
+
+
+# timed returns a context manager that times the code inside it as the
+# stage name, e.g. with timed('getplanes'): ...
+def timed(name):
+    if not enabled:
+        return idle
+    return Timer(name)
+
+
+# count adds n to the counter name
+def count(name, n=1):
+    if enabled:
+        with lock:
+            counters[name] += n
+
+
+# include adds the counters in the dict stats, kept by another module,
+# under the name source
+def include(source, stats):
+    sources[source] = stats
+
+
+# metrics returns everything in Prometheus text format
+def metrics():
+    lines = []
+    with lock:
+        name = prefix + '_stage_seconds'
+        lines.append('# HELP %s How long each stage of a cycle takes.' % name)
+        lines.append('# TYPE %s summary' % name)
+        for stage_name in sorted(stages):
+            stage = stages[stage_name]
+            for q, value in zip(quantiles, stage.percentiles()):
+                lines.append('%s{stage="%s",quantile="%g"} %.6f' % (name, stage_name, q, value))
+            lines.append('%s_sum{stage="%s"} %.6f' % (name, stage_name, stage.total))
+            lines.append('%s_count{stage="%s"} %d' % (name, stage_name, stage.count))
+
+        for counter in sorted(counters):
+            name = '%s_%s_total' % (prefix, counter)
+            lines.append('# TYPE %s counter' % name)
+            lines.append('%s %d' % (name, counters[counter]))
+
+    # The other modules' counters are read without their locks, a value
+    # that is a cycle out of date doesn't matter here
+    for source in sorted(sources):
+        stats = sources[source]
+        for key in sorted(stats):
+            lines.append('%s_%s_%s %g' % (prefix, source, key, stats[key]))
+    return '\n'.join(lines) + '\n'
+
+
+# serve starts answering requests for /metrics on host:port in a
+# background thread. http.server is only imported here since metrics
+# are usually off and it takes a while to import on a Raspberry Pi
+def serve(host, port):
+    global server
+    import http.server
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = metrics().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        # Requests aren't logged
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+# write_file writes everything to METRICS_FILE, through a temporary
+# file so that it is never read half written
+def write_file():
+    try:
+        with open(METRICS_FILE + '.tmp', 'w') as f:
+            f.write(metrics())
+        os.replace(METRICS_FILE + '.tmp', METRICS_FILE)
+    except OSError as e:
+        print("Metrics file not written: %s" % e)
+
+
+# file_writer is the thread that writes METRICS_FILE every file_interval
+# seconds
+def file_writer():
+    while True:
+        time.sleep(file_interval)
+        write_file()
+
+
+# start starts serving METRICS and writing METRICS_FILE, whichever are
+# set. It does nothing if it has already been called
+def start():
+    global started
+    if started or not enabled:
+        return
+    started = True
+
+    if METRICS:
+        host, port = METRICS.rsplit(':', 1)
+        try:
+            serve(host, int(port))
+        except (OSError, ValueError) as e:
+            print("Metrics not served on %s: %s" % (METRICS, e))
+
+    if METRICS_FILE:
+        threading.Thread(target=file_writer, daemon=True).start()
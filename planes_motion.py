@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+# FUNCTIONS TO CONTROL THE MODEL AIRCRAFT USED TO INDICATE THE TRACK
+# OF THE AIRCRAFT
+#
+# The stepper motor is driven by its own thread so that turning the
+# model doesn't hold up the rest of the program. The thread is given a
+# heading to turn to and ramps the speed up and down (a trapezoidal
+# profile) so that it can run faster than a fixed step rate without
+# missing steps. A new heading can be given at any time, even in the
+# middle of a move.
+#
+# The GPIO module is passed in so that planes_simgpio can be used to
+# try this out without the hardware.
+
+import math
+import threading
+import time
+
+# These are the GPIO pins to which the four coils are connected
+
+coilApin = 4
+coilBpin = 17
+coilCpin = 27
+coilDpin = 22
+
+# There are revolution steps of the motor in a complete revolution and
+# degree steps per degree
+
+revolution = 2038
+degree = 2038 / 360
+
+# This defines the sequence of coil activations for the stepper motor
+
+steps = 4
+seq = list(range(steps))
+seq[0] = [True, True, False, False]
+seq[1] = [False, True, True, False]
+seq[2] = [False, False, True, True]
+seq[3] = [True, False, False, True]
+
+# The speed profile in steps per second (and steps per second per
+# second). Moves start and stop at start_speed, which the motor can do
+# from standstill, and speed up to max_speed in between. The original
+# fixed rate was 500 steps per second
+
+start_speed = 250.0
+max_speed = 800.0
+acceleration = 1500.0
+
+
+# stopping_steps returns how many steps it takes to slow down from
+# speed to start_speed
+def stopping_steps(speed):
+    return max(0.0, (speed * speed - start_speed * start_speed) / (2 * acceleration))
+
+
+# MotionController owns the stepper motor. position is the current
+# position of the motor in the range 0 to revolution-1. on_idle is
+# called from the motor thread whenever a move finishes
+class MotionController:
+    def __init__(self, gpio, position=0, on_idle=None):
+        self.gpio = gpio
+        self.position = position
+        self.current_step = 0
+        self.on_idle = on_idle
+
+        # remaining is the number of steps still to go (positive is
+        # clockwise). moving is True while the motor is turning
+        self.remaining = 0
+        self.moving = False
+        self.condition = threading.Condition()
+
+        # step_lock is held while a step is made so that rotate() and
+        # the thread can't both drive the coils
+        self.step_lock = threading.Lock()
+
+        for pin in [coilApin, coilBpin, coilCpin, coilDpin]:
+            gpio.setup(pin, gpio.OUT)
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # set_coils sets the coils on the stepper motor and is typically
+    # used with seq[] above
+    def set_coils(self, a, b, c, d):
+        self.gpio.output(coilApin, a)
+        self.gpio.output(coilBpin, b)
+        self.gpio.output(coilCpin, c)
+        self.gpio.output(coilDpin, d)
+
+    # step moves the motor one step clockwise (direction 1) or
+    # anti-clockwise (direction -1) and updates position and
+    # current_step to keep track of the current motor position and
+    # which step in seq[] to use next
+    def step(self, direction):
+        self.current_step = (self.current_step + direction) % steps
+        self.position = (self.position + direction) % revolution
+        s = seq[self.current_step]
+        self.set_coils(s[0], s[1], s[2], s[3])
+
+    # off turns off all the coils on the stepper motor. Since there is
+    # no torque on the motor needed between movements we can switch it
+    # off
+    def off(self):
+        self.set_coils(False, False, False, False)
+
+    # track turns the plane to point to the angle track degrees from
+    # north and returns straight away. It uses position to determine the
+    # number of steps needed and goes by the shortest route (clockwise
+    # or anti-clockwise). Since the stepper motor moves in units of
+    # 360/2038 degrees the target is rounded to the nearest step, so the
+    # plane is never more than half a step out and being given the same
+    # heading again doesn't move it
+    def track(self, track):
+        with self.condition:
+            delta = int(round(track * degree)) - self.position
+            delta %= revolution
+            if delta > revolution / 2:
+                delta -= revolution
+
+            self.remaining = delta
+            self.condition.notify_all()
+
+    # stop stops any move in progress where the motor is and waits for
+    # it to stop. A motor that is going too fast to stop dead slows down
+    # past that point and comes back to it
+    def stop(self):
+        with self.condition:
+            self.remaining = 0
+            self.condition.notify_all()
+        self.wait()
+
+    # wait waits until the motor has stopped, for at most timeout
+    # seconds. It returns True if the motor has stopped
+    def wait(self, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.remaining == 0 and not self.moving, timeout)
+
+    # reset stops the motor and sets its position, used after
+    # calibration
+    def reset(self, position):
+        self.stop()
+        with self.condition:
+            self.position = position
+
+    # rotate moves the plane count steps in a clockwise or
+    # anti-clockwise direction with a delay of delay seconds between
+    # steps. Unlike track it returns when the move is done. It's used
+    # to turn the plane by hand during calibration
+    def rotate(self, delay, count, clockwise=True):
+        self.stop()
+        direction = 1 if clockwise else -1
+        with self.step_lock:
+            for i in range(count):
+                self.step(direction)
+                time.sleep(delay)
+            self.off()
+
+    # run is the motor thread. It waits for steps to do and makes them
+    # with the speed profile, slowing down in time to stop at the
+    # target. If the target changes to one that is behind the motor, or
+    # closer than it can stop in, the motor carries on slowing down past
+    # it and comes back once it is down to start_speed
+    def run(self):
+        speed = 0.0
+        direction = 0
+        next_time = time.monotonic()
+
+        while True:
+            with self.condition:
+                # ahead is how many steps the target is in front of the
+                # motor in the way it's going (negative if it's behind)
+                ahead = self.remaining * direction
+                braking = speed > 0 and stopping_steps(speed) > max(ahead, 0) + 1e-6
+
+                if self.remaining == 0 and not braking:
+                    if self.moving:
+                        self.moving = False
+                        self.off()
+                        self.condition.notify_all()
+                        if self.on_idle is not None:
+                            self.on_idle()
+                    self.condition.wait_for(lambda: self.remaining != 0)
+                    speed = 0.0
+                    next_time = time.monotonic()
+
+                self.moving = True
+
+                if braking:
+                    # Going too fast to stop at the target, so slow down
+                    # carrying on the same way. A step past the target
+                    # adds to the way back
+                    speed = math.sqrt(max(start_speed ** 2, speed * speed - 2 * acceleration))
+                else:
+                    want = 1 if self.remaining > 0 else -1
+                    if want != direction:
+                        speed = 0.0
+                    direction = want
+                    left = abs(self.remaining)
+                    faster = min(max_speed, math.sqrt(speed * speed + 2 * acceleration))
+                    if speed == 0:
+                        speed = start_speed
+                    elif stopping_steps(faster) <= left - 1 + 1e-6:
+                        speed = faster
+                    elif stopping_steps(speed) > left - 1 + 1e-6:
+                        speed = math.sqrt(max(start_speed ** 2, speed * speed - 2 * acceleration))
+                self.remaining -= direction
+
+                with self.step_lock:
+                    self.step(direction)
+
+            next_time += 1.0 / speed
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.monotonic()
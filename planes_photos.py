@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+# A store of aircraft photos, kept on disk already resized for the
+# screen. A photo is downloaded straight into a file, resized once to
+# photo_width pixels wide and saved as photos/<hex>.jpg, so an aircraft
+# that has been seen before needs no network requests and no resizing.
+# The least recently used photos are deleted once the store grows past
+# max_bytes, and the few photos most recently used (which includes the
+# aircraft being tracked) are also kept decoded in memory
+#
+# Which URL the photo of an aircraft is at (or that there isn't one) is
+# kept in planes_cache like the other lookups
+
+import collections
+import os
+import threading
+import time
+
+from PIL import Image
+
+photo_dir = 'photos'
+photo_width = 220
+
+# Limits on the store on disk and the number of decoded photos kept in
+# memory. Photos older than max_age seconds are downloaded again
+
+max_bytes = 32 * 1024 * 1024
+max_age = 7 * 24 * 60 * 60
+memory_count = 4
+
+# memory maps a hex code to its decoded photo with the most recently
+# used at the end
+
+memory = collections.OrderedDict()
+lock = threading.Lock()
+
+# Counters of where photos came from
+
+stats = {
+    'memory': 0,
+    'disk': 0,
+    'downloads': 0,
+    'evicted': 0,
+}
+
+
+# path returns the file the photo of hexcode is kept in
+def path(hexcode):
+    return os.path.join(photo_dir, '%s.jpg' % hexcode)
+
+
+# keep puts img into the in memory photos, dropping the least recently
+# used. Must be called with lock held
+def keep(hexcode, img):
+    memory[hexcode] = img
+    memory.move_to_end(hexcode)
+    while len(memory) > memory_count:
+        memory.popitem(last=False)
+
+
+# load returns the photo of hexcode from memory or disk, or None if it
+# isn't stored (or is too old). Using a photo on disk updates its access
+# time, which is what the least recently used are found by
+def load(hexcode):
+    with lock:
+        img = memory.get(hexcode)
+        if img is not None:
+            memory.move_to_end(hexcode)
+            stats['memory'] += 1
+            return img
+
+    filename = path(hexcode)
+    try:
+        st = os.stat(filename)
+        if time.time() - st.st_mtime > max_age:
+            return None
+        img = Image.open(filename)
+        img.load()
+        os.utime(filename, (time.time(), st.st_mtime))
+    except (OSError, ValueError):
+        return None
+
+    with lock:
+        keep(hexcode, img)
+        stats['disk'] += 1
+    return img
+
+
+# store saves the downloaded photo in the file raw as the photo of
+# hexcode, resized to photo_width, and returns it. raw is removed
+def store(hexcode, raw):
+    try:
+        pic = Image.open(raw)
+        pic.load()
+    finally:
+        os.remove(raw)
+
+    wpercent = (photo_width / float(pic.size[0]))
+    hsize = int((float(pic.size[1]) * float(wpercent)))
+    img = pic.convert('RGB').resize((photo_width, hsize), Image.LANCZOS)
+
+    # Written to a temporary file and then renamed so that a half
+    # written photo is never loaded
+    filename = path(hexcode)
+    img.save(filename + '.tmp', 'JPEG', quality=90)
+    os.replace(filename + '.tmp', filename)
+
+    with lock:
+        keep(hexcode, img)
+        stats['downloads'] += 1
+    prune()
+    return img
+
+
+# prune deletes the least recently used photos until the store is
+# within max_bytes
+def prune():
+    files = []
+    total = 0
+    for name in os.listdir(photo_dir):
+        if not name.endswith('.jpg'):
+            continue
+        try:
+            st = os.stat(os.path.join(photo_dir, name))
+        except OSError:
+            continue
+        files.append((st.st_atime, st.st_size, name))
+        total += st.st_size
+
+    # The most recently used is always kept
+    files.sort()
+    for atime, size, name in files[:-1]:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(photo_dir, name))
+        except OSError:
+            continue
+        total -= size
+        stats['evicted'] += 1
+
+
+# photo returns the photo of hexcode, calling download(filename) to
+# fetch it into filename if it isn't stored. download should return
+# True if it got the photo, False if there is no photo of the aircraft
+# or None if it failed. Returns the photo as a PIL image, False if
+# there isn't one or None if it couldn't be fetched
+def photo(hexcode, download):
+    img = load(hexcode)
+    if img is not None:
+        return img
+
+    os.makedirs(photo_dir, exist_ok=True)
+    raw = os.path.join(photo_dir, '%s.%d.download' % (hexcode, threading.get_ident()))
+    try:
+        got = download(raw)
+    except Exception:
+        got = None
+    if not got:
+        if os.path.exists(raw):
+            os.remove(raw)
+        return got
+
+    try:
+        return store(hexcode, raw)
+    except (OSError, ValueError):
+        # Not an image we can read
+        return False
+
+
+# summary returns a line describing where photos came from
+def summary():
+    return 'Photos: %d from memory, %d from disk, %d downloaded, %d evicted' % (
+        stats['memory'], stats['disk'], stats['downloads'], stats['evicted'])
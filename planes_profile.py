@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+# Profiles the main loop on demand. Sending the running planes.py
+# SIGUSR1 (kill -USR1 <pid>) profiles the next cycles cycles of the
+# loop, and sending it again while that is going on stops early. Two
+# profilers run at the same time:
+#
+# cProfile, on the main thread, which is written as a .pstats file for
+# python3 -m pstats, snakeviz and the like
+#
+# a sampling profiler, which looks at the stack of every thread every
+# sample_interval seconds and is written as collapsed stacks (one
+# "frame;frame;frame count" line per stack) for flamegraph.pl,
+# speedscope and the like. Threads sitting idle waiting for work aren't
+# counted
+#
+# The files are named after when the profile was taken, the source the
+# aircraft were read from and how many aircraft there were, and a .txt
+# file alongside has the most expensive functions
+#
+# cProfile and pstats are only imported once a profile is asked for
+
+import collections
+import io
+import os
+import signal
+import sys
+import threading
+import time
+
+from planes_config import SOURCE, FUSION
+
+profile_dir = 'profiles'
+cycles = 20
+sample_interval = 0.005
+
+# Stacks whose innermost frame is one of these (file, function) are
+# threads waiting for something to do
+
+idle_frames = set([
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('thread.py', '_worker'),
+])
+
+# requested is set by the signal and picked up at the start of the next
+# cycle. While profiling, remaining is the number of cycles left and
+# counts has the number of aircraft in each cycle profiled so far
+
+requested = False
+profiler = None
+sampler = None
+stopping = threading.Event()
+remaining = 0
+counts = []
+started = 0.0
+
+# samples maps a collapsed stack to the number of times it was seen
+
+samples = collections.Counter()
+idle_samples = 0
+
+
+# request is the SIGUSR1 handler. It only sets a flag, the profilers
+# are started and stopped between cycles
+def request(signum, frame):
+    global requested
+    requested = True
+
+
+# install sets up SIGUSR1 to start profiling
+def install():
+    signal.signal(signal.SIGUSR1, request)
+
+
+# label returns the name of the function running in frame as it appears
+# in the collapsed stacks, e.g. planes_render.py:text
+def label(frame):
+    code = frame.f_code
+    return '%s:%s' % (os.path.basename(code.co_filename), code.co_name)
+
+
+# sample adds the stack of every thread but this one to samples
+def sample():
+    global idle_samples
+    me = threading.get_ident()
+    names = dict([(t.ident, t.name) for t in threading.enumerate()])
+    for ident, frame in sys._current_frames().items():
+        if ident == me:
+            continue
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in idle_frames:
+            idle_samples += 1
+            continue
+        stack = []
+        while frame is not None:
+            stack.append(label(frame))
+            frame = frame.f_back
+        stack.append(names.get(ident, 'thread-%d' % ident))
+        stack.reverse()
+        samples[';'.join(stack).replace(' ', '_')] += 1
+
+
+# run_sampler is the thread that samples the stacks until stopping is set
+def run_sampler():
+    while not stopping.wait(sample_interval):
+        sample()
+
+
+# begin is called at the start of each cycle and starts profiling if it
+# has been asked for
+def begin():
+    global requested
+    global profiler
+    global sampler
+    global remaining
+    global started
+    global idle_samples
+
+    if not requested or profiler is not None:
+        return
+    requested = False
+
+    import cProfile
+
+    print("Profiling the next %d cycles" % cycles)
+    remaining = cycles
+    del counts[:]
+    samples.clear()
+    idle_samples = 0
+    started = time.time()
+
+    stopping.clear()
+    sampler = threading.Thread(target=run_sampler, daemon=True)
+    sampler.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+
+# end is called at the end of each cycle with the number of aircraft
+# read from the feed. Once enough cycles have been profiled (or the
+# signal has been sent again) the profile is written
+def end(aircraft):
+    global requested
+    global profiler
+    global remaining
+
+    if profiler is None:
+        return
+    counts.append(aircraft)
+    remaining -= 1
+    if remaining > 0 and not requested:
+        return
+    requested = False
+
+    profiler.disable()
+    stopping.set()
+    sampler.join()
+    try:
+        write(profiler)
+    except OSError as e:
+        print("Profile not written: %s" % e)
+    profiler = None
+
+
+# source returns the name of the source the aircraft are read from, for
+# naming the profile
+def source():
+    if SOURCE == "FUSION":
+        return 'FUSION-' + '+'.join(FUSION)
+    return SOURCE
+
+
+# write writes the profile taken by profiler and the samples to
+# profile_dir
+def write(profiler):
+    import pstats
+
+    os.makedirs(profile_dir, exist_ok=True)
+    average = sum(counts) / max(len(counts), 1)
+    base = os.path.join(profile_dir, 'profile-%s-%s-%dac' % (
+        time.strftime('%Y%m%d-%H%M%S', time.localtime(started)), source(), round(average)))
+
+    profiler.dump_stats(base + '.pstats')
+
+    with open(base + '.collapsed', 'w') as f:
+        for stack, n in sorted(samples.items()):
+            f.write('%s %d\n' % (stack, n))
+
+    text = io.StringIO()
+    text.write('Source: %s\n' % source())
+    text.write('Cycles: %d in %.1f seconds\n' % (len(counts), time.time() - started))
+    text.write('Aircraft: %d to %d, %.1f average\n' % (min(counts), max(counts), average))
+    text.write('Samples: %d busy, %d idle\n\n' % (sum(samples.values()), idle_samples))
+    stats = pstats.Stats(profiler, stream=text)
+    stats.sort_stats('cumulative').print_stats(30)
+    stats.sort_stats('tottime').print_stats(30)
+    with open(base + '.txt', 'w') as f:
+        f.write(text.getvalue())
+
+    print("Profile written to %s.pstats, .collapsed and .txt" % base)
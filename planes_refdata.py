@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+
+# Reference data (airports, airlines and aircraft types) used to turn
+# the codes we get from the APIs into names for the screen
+#
+# Parsing the CSV files takes a while on a Raspberry Pi, so the indexes
+# are compiled into a binary file next to each one (airports.dat.idx
+# and so on) which is memory mapped instead of loaded. Only the rows
+# that are looked up are ever read from it. The compiled file records
+# the mtime and size of the CSV it was built from and is built again
+# whenever they change
+
+import csv
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+AIRPORTS_FILE = 'airports.dat'
+AIRLINES_FILE = 'airlines.dat'
+AIRCRAFT_FILE = 'planes.dat'
+
+# Values used in the .dat files to mean "no code"
+
+missing = ['', '\\N', '-', 'N/A']
+
+# The files are only stat()ed at most once every check_interval seconds
+# so that a lookup doesn't cost a system call but editing a CSV while
+# the program is running is still picked up almost immediately
+
+check_interval = 1.0
+
+# A compiled file is a header, the ICAO index, the IATA index and then
+# the rows. An index is its entries sorted by key, each entry being the
+# key (padded with zero bytes to key_size), and the offset and length
+# of its row. A row is its fields separated by field_separator
+
+compiled_suffix = '.idx'
+compiled_magic = b'AERODAT1'
+key_size = 16
+field_separator = '\x1f'
+
+header = struct.Struct('<8sqqII')
+entry = struct.Struct('<%dsII' % key_size)
+
+# Only one thread builds compiled files at a time
+
+compile_lock = threading.Lock()
+
+# tables maps a filename to [mtime, last checked, indexes] where
+# indexes is whatever the loader for that file returned
+
+tables = {}
+
+
+# findcsv reads a CSV file from filename and tries to find match in
+# column col. If it finds it returns the row, if it doesn't it returns
+# a fake row containing match. This is the original linear scan, it's
+# kept as the reference for the indexed lookups below and for
+# planes_bench.py
+def findcsv(filename, col, match):
+    with open(filename, 'r') as f:
+        r = csv.reader(f)
+        for row in r:
+            if row[col] == match.strip():
+                return row
+
+    return [match, match, match, match, match]
+
+
+# add_key adds row to index under key unless the key is one of the
+# missing values or is already taken (the first row in the file wins,
+# which is what findcsv did)
+def add_key(index, key, row):
+    if key in missing or key in index:
+        return
+    index[key] = row
+
+
+# load_airports indexes airports.dat by ICAO (column 5) and IATA
+# (column 4) code
+def load_airports(filename):
+    icao = {}
+    iata = {}
+    with open(filename, 'r') as f:
+        for row in csv.reader(f):
+            if len(row) < 6:
+                continue
+            add_key(icao, row[5], row)
+            add_key(iata, row[4], row)
+    return icao, iata
+
+
+# load_airlines indexes airlines.dat by ICAO (column 4) and IATA
+# (column 3) code. The ICAO code is also the prefix of the callsign
+# so it is used for callsign lookups. Active airlines (column 7 is Y)
+# are preferred over defunct ones that reused the same code
+def load_airlines(filename):
+    icao = {}
+    iata = {}
+    with open(filename, 'r') as f:
+        rows = [row for row in csv.reader(f) if len(row) >= 8]
+    rows.sort(key=lambda row: row[7] != 'Y')
+    for row in rows:
+        add_key(icao, row[4], row)
+        add_key(iata, row[3], row)
+    return icao, iata
+
+
+# load_aircraft indexes planes.dat by ICAO (column 2) and IATA
+# (column 1) type code
+def load_aircraft(filename):
+    icao = {}
+    iata = {}
+    with open(filename, 'r') as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            add_key(icao, row[2], row)
+            add_key(iata, row[1], row)
+    return icao, iata
+
+
+# Table is one index of a compiled file, the count entries starting at
+# start in the memory map mm. It is looked up with get like a dict and
+# keeps the rows it has found
+class Table:
+    def __init__(self, mm, start, count):
+        self.mm = mm
+        self.start = start
+        self.count = count
+        self.found = {}
+
+    # key returns the key of entry i
+    def key(self, i):
+        at = self.start + i * entry.size
+        return self.mm[at:at + key_size]
+
+    # get returns the row for code or default if there isn't one
+    def get(self, code, default=None):
+        row = self.found.get(code, False)
+        if row is not False:
+            return default if row is None else row
+
+        key = code.encode('utf-8')
+        row = None
+        if len(key) <= key_size:
+            key = key.ljust(key_size, b'\0')
+            lo = 0
+            hi = self.count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.key(mid) < key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo < self.count and self.key(lo) == key:
+                k, offset, length = entry.unpack_from(self.mm, self.start + lo * entry.size)
+                row = self.mm[offset:offset + length].decode('utf-8').split(field_separator)
+
+        self.found[code] = row
+        return default if row is None else row
+
+
+# write_compiled writes the indexes icao and iata (as returned by a
+# loader) to the compiled file path for a CSV file with os.stat() st
+def write_compiled(path, st, icao, iata):
+    rows = []
+    offsets = {}
+    blob = bytearray()
+    indexes = []
+    for index in (icao, iata):
+        entries = []
+        for key, row in index.items():
+            k = key.encode('utf-8')
+            if len(k) > key_size:
+                continue
+            if id(row) not in offsets:
+                data = field_separator.join(row).encode('utf-8')
+                offsets[id(row)] = (len(blob), len(data))
+                rows.append(row)
+                blob += data
+            entries.append((k.ljust(key_size, b'\0'),) + offsets[id(row)])
+        entries.sort()
+        indexes.append(entries)
+
+    start = header.size + entry.size * (len(indexes[0]) + len(indexes[1]))
+    with open(path + '.tmp', 'wb') as f:
+        f.write(header.pack(compiled_magic, st.st_mtime_ns, st.st_size,
+                            len(indexes[0]), len(indexes[1])))
+        for entries in indexes:
+            for key, offset, length in entries:
+                f.write(entry.pack(key, start + offset, length))
+        f.write(blob)
+    os.replace(path + '.tmp', path)
+
+
+# open_compiled returns the ICAO and IATA Tables of the compiled file
+# path or None if it doesn't exist or wasn't built from the CSV file
+# with os.stat() st
+def open_compiled(path, st):
+    try:
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, mtime, size, icao_count, iata_count = header.unpack_from(mm, 0)
+    except (OSError, ValueError, struct.error):
+        return None
+    if magic != compiled_magic or mtime != st.st_mtime_ns or size != st.st_size:
+        return None
+    icao = Table(mm, header.size, icao_count)
+    iata = Table(mm, header.size + icao_count * entry.size, iata_count)
+    return icao, iata
+
+
+# compiled returns the indexes of filename from its compiled file,
+# building it with loader first if it is missing or out of date. If
+# the compiled file can't be written the indexes are loaded as dicts
+def compiled(filename, loader):
+    st = os.stat(filename)
+    path = filename + compiled_suffix
+    with compile_lock:
+        indexes = open_compiled(path, st)
+        if indexes is None:
+            loaded = loader(filename)
+            try:
+                write_compiled(path, st, *loaded)
+            except OSError:
+                return loaded
+            indexes = open_compiled(path, st)
+            if indexes is None:
+                return loaded
+    return indexes
+
+
+# index returns the indexes for filename, loading them with loader the
+# first time and again whenever the file's mtime changes. If the file
+# can't be read the indexes are empty
+def index(filename, loader):
+    now = time.monotonic()
+    t = tables.get(filename)
+    if t is not None and now - t[1] < check_interval:
+        return t[2]
+
+    try:
+        mtime = os.stat(filename).st_mtime
+    except OSError:
+        mtime = None
+
+    if t is None or t[0] != mtime:
+        indexes = ({}, {})
+        if mtime is not None:
+            try:
+                indexes = compiled(filename, loader)
+            except (OSError, csv.Error, UnicodeDecodeError):
+                pass
+        t = [mtime, now, indexes]
+        tables[filename] = t
+    else:
+        t[1] = now
+
+    return t[2]
+
+
+# lookup looks for code first in the ICAO index and then in the IATA
+# index returned by index() and returns the row or None
+def lookup(filename, loader, code):
+    code = code.strip().upper()
+    if code == '':
+        return None
+    icao, iata = index(filename, loader)
+    row = icao.get(code)
+    if row is None:
+        row = iata.get(code)
+    return row
+
+
+# airport returns the airports.dat row for an ICAO or IATA code. Like
+# findcsv it returns a fake row containing code if the airport isn't
+# known so that the name, city and country can always be displayed
+def airport(code):
+    row = lookup(AIRPORTS_FILE, load_airports, code)
+    if row is None:
+        return [code, code, code, code, code]
+    return row
+
+
+# airline returns the airlines.dat row for an ICAO or IATA airline
+# code or None
+def airline(code):
+    return lookup(AIRLINES_FILE, load_airlines, code)
+
+
+# Callsigns that are an airline code followed by a flight number: the
+# three letter ICAO code and a number (which can end in letters, like
+# BAW12X) or the two letter IATA code and a number of up to four digits
+# with at most one letter after it. Anything else, like a registration
+# used as a callsign (N123AB, GBNLJ), isn't an airline's flight
+
+icao_flight = re.compile(r'([A-Z]{3})[0-9][0-9A-Z]*$')
+iata_flight = re.compile(r'([A-Z]{2})[0-9]{1,4}[A-Z]?$')
+
+
+# airline_for_flight returns the airlines.dat row for the airline
+# flying flight (a callsign like BAW123 or a flight number like
+# BA123) or None if it isn't an airline's flight
+def airline_for_flight(flight):
+    flight = flight.strip().upper()
+    icao, iata = index(AIRLINES_FILE, load_airlines)
+    m = icao_flight.match(flight)
+    if m:
+        return icao.get(m.group(1))
+    m = iata_flight.match(flight)
+    if m:
+        return iata.get(m.group(1))
+    return None
+
+
+# aircraft_type returns the planes.dat row for an ICAO or IATA
+# aircraft type code or None
+def aircraft_type(code):
+    return lookup(AIRCRAFT_FILE, load_aircraft, code)
+
+
+# prepare opens (compiling them if needed) the indexes of all the files
+# so the first lookups don't have to wait
+def prepare():
+    index(AIRPORTS_FILE, load_airports)
+    index(AIRLINES_FILE, load_airlines)
+    index(AIRCRAFT_FILE, load_aircraft)
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+
+# FUNCTIONS FOR DRAWING TEXT AND IMAGES ON THE SCREEN
+#
+# Everything that is drawn is built here as a 320x480 PIL image. The
+# fonts, the size that each string fits at, the flags and the icons
+# are all loaded once and kept, since the same few strings are drawn
+# every cycle
+
+from PIL import Image, ImageDraw, ImageFont
+import os
+
+font_file = 'DejaVuSansMono.ttf'
+
+# fonts maps a size in pt to the loaded font
+
+fonts = {}
+
+
+# font returns the font at size s
+def font(s):
+    f = fonts.get(s)
+    if f is None:
+        f = ImageFont.truetype(font_file, s)
+        fonts[s] = f
+    return f
+
+
+# text_size returns the width and height of t in font f. Newer versions
+# of Pillow don't have getsize so the bounding box is used instead
+def text_size(f, t):
+    try:
+        return f.getsize(t)
+    except AttributeError:
+        box = f.getbbox(t)
+        return box[2], box[3]
+
+
+# flags maps the name of a country to its flag already resized to 38x25
+# (or None if there isn't a flag) and icons maps a file name to the
+# loaded image
+
+flags = {}
+icons = {}
+
+
+# icon returns the image in filename, loading it the first time
+def icon(filename):
+    i = icons.get(filename)
+    if i is None:
+        i = Image.open(filename, 'r')
+        i.load()
+        icons[filename] = i
+    return i
+
+
+# flag tries to find the flag of the country named in country
+# by looking for a file called images/country.gif (any spaces
+# in the country name are turned into -). If found it inserts
+# the flag into img and then returns the new x position where
+# its safe to write to the image and not overwrite the flag.
+# All flags are resized to 38x25 for consistency
+def flag(img, country, x, y):
+    if country not in flags:
+        country_gif = 'images/' + country.lower() + '.gif'
+        country_gif = country_gif.replace(' ', '-')
+
+        flags[country] = None
+        if os.path.isfile(country_gif):
+            country_img = Image.open(country_gif, 'r')
+            flags[country] = country_img.resize((38, 25))
+            country_img.close()
+
+    country_img = flags[country]
+    if country_img is not None:
+        img.paste(country_img, (x, y + 3))
+        return x + 45
+
+    return x
+
+
+# The number of pixels to leave between lines of text on the screen
+
+spacing = 4
+
+last_text = ''
+
+# fits remembers where text() put each string: it maps (string, size,
+# x, position) to (font, x, width, height) for the size that fits, or
+# None if it doesn't fit at any size. It's emptied if it grows past
+# max_fits entries
+
+fits = {}
+max_fits = 2000
+
+
+# fit works out the largest font size no bigger than s that t fits
+# across the screen at when drawn at x with the given position. It
+# returns (font, x, width, height) or None if it doesn't fit
+def fit(t, s, x, position):
+    key = (t, s, x, position)
+    if key in fits:
+        return fits[key]
+
+    result = None
+    while s >= 10:
+        lx = x
+        f = font(s)
+        (w, h) = text_size(f, t)
+        if position == 'r':
+            lx = x - w
+            if lx < 200:
+                lx = 200
+        if position == 'c':
+            lx = x - (w/2)
+        if w <= 320 - lx:
+            result = (f, lx, w, h)
+            break
+        s -= 2
+
+    if len(fits) >= max_fits:
+        fits.clear()
+    fits[key] = result
+    return result
+
+
+# text writes a line of text to d automatically adjusting the font
+# size to fit the text on screen. It returns the new y position where
+# text can be written based on the size of the text and the spacing
+# value. Note that it uses last_text to automatically prevent the same
+# string being written twice sequentially (this is done to eliminate
+# airports that have the same name as the town they are in)
+#
+# The up parameter determines whether the text is being written top to
+# bottom on the screen (up = False) or up from the bottom (up = True)
+#
+# The default (preferred) font size is s (in pt) and will
+# automatically be reduced until the text fits across the screen
+def text(d, x, y, t, s, up=False, position='l', colour=(240, 240, 240)):
+    global last_text
+    if last_text == t:
+        return y
+    last_text = t
+
+    fitted = fit(t, s, x, position)
+    if fitted is None:
+        return y
+
+    (f, lx, w, h) = fitted
+    if up:
+        y -= h
+    d.text((lx, y), t, colour, font=f)
+
+    if up:
+        return y - spacing
+    else:
+        return y + h + spacing
+
+
+# new_frame returns a blank image the size of the screen and something
+# to draw on it with
+def new_frame():
+    global last_text
+    last_text = ''
+    img = Image.new('RGB', (320, 480), color=(0, 0, 0))
+    return img, ImageDraw.Draw(img)
+
+
+# Frames of an aircraft are drawn in two layers. The static layer has
+# everything that stays the same while an aircraft is tracked (the
+# airline, registration, route, flags and photo) and is only drawn when
+# the aircraft or its details change. Each frame is a copy of it with
+# the distance and altitude written on top. If nothing visible has
+# changed since the last frame there's nothing to draw at all
+#
+# static_key says what is in static_img and dynamic holds (slot, y)
+# for where the distance (slot 0) and altitude (slot 1) go. last_frame
+# says what the last frame showed
+
+static_key = None
+static_img = None
+dynamic = []
+last_frame = None
+
+# frames counts how each frame of an aircraft was drawn: full (the
+# static layer was drawn too), partial (only the distance and altitude
+# were drawn) or skipped (nothing changed)
+
+frames = {'full': 0, 'partial': 0, 'skipped': 0}
+
+
+# skip_text works out where text() would write t, without writing it,
+# and returns the new y position. The y position is added to dynamic
+# along with slot so that the text in that slot can be written there
+# later
+def skip_text(x, y, slot, t, s):
+    global last_text
+    if last_text == t:
+        return y
+    last_text = t
+
+    fitted = fit(t, s, x, 'l')
+    if fitted is None:
+        return y
+
+    dynamic.append((slot, y))
+    return y + fitted[3] + spacing
+
+
+# draw_static draws the static layer of an aircraft into static_img,
+# leaving gaps for dist_text and alt_text
+def draw_static(flight, airline, from_airport, from_country,
+                to_airport, to_country, aircraftmodel, type,
+                reg, photo, dist_text, alt_text):
+    global static_img
+    img, d = new_frame()
+    del dynamic[:]
+
+    y = 0
+    y = text(d, 160, y, airline, 32, position='c')
+    text(d, 310, y, reg, 24, position='r')
+    y = text(d, 10, y, flight, 24)
+    text(d, 310, y, str(aircraftmodel), 24, position='r')
+    y = skip_text(10, y, 0, dist_text, 24)
+    text(d, 310, y, str(type), 24, position='r')
+    y = skip_text(10, y, 1, alt_text, 24)
+    y += 3
+    d.line([(0, y), (320, y)])
+    y += 3
+    # TODO: do this on loading the CSV
+    from_airport = from_airport.replace(' Airport', '')
+    to_airport = to_airport.replace(' Airport', '')
+    from_airport = from_airport.replace(' International', '')
+    to_airport = to_airport.replace(' International', '')
+
+    y = text(d, 160, y, from_airport, 24, position='c')
+    flag(img, from_country, 10, y)
+    y = text(d, 160, y, from_country, 24, position='c')
+    y += spacing
+
+    down = icon('images/down.png')
+    (w, h) = down.size
+    img.paste(down, (int(160-(w/2)), y), down)
+    y += h + spacing
+
+    y = text(d, 160, y, to_airport, 24, position='c')
+    flag(img, to_country, 10, y)
+    y = text(d, 160, y, to_country, 24, position='c')
+    y += spacing * 2
+    if photo is not False:
+        # The photo comes from planes_photos already resized
+        (w, h) = photo.size
+        img.paste(photo, box=(40, 470-h))
+
+    static_img = img
+
+
+# draw_spotted returns the image of an aircraft that spotted() shows,
+# or None if it would be exactly the same as the last one
+def draw_spotted(flight, airline, from_airport, from_country,
+                 to_airport, to_country, aircraftmodel, type, altitude,
+                 reg, photo, dist):
+    global static_key
+    global last_frame
+
+    dist_text = str(round(dist,1)) + ' miles'
+    alt_text = str(altitude) + ' ft'
+
+    # photo is a PIL image (or False). Comparing images compares every
+    # pixel so it's compared by identity instead, which is safe as
+    # planes_photos keeps the same image for as long as it's shown
+    photo_key = id(photo) if photo is not False else False
+    details = (flight, airline, from_airport, from_country, to_airport, to_country,
+               str(aircraftmodel), str(type), reg, photo_key)
+    if last_frame == (details, dist_text, alt_text):
+        frames['skipped'] += 1
+        return None
+    last_frame = (details, dist_text, alt_text)
+
+    # The rows below the distance and altitude move if their height
+    # changes so that has to match too
+    heights = []
+    for t in [dist_text, alt_text]:
+        fitted = fit(t, 24, 10, 'l')
+        heights.append(fitted[3] if fitted is not None else None)
+    key = (details, tuple(heights))
+
+    if key != static_key:
+        draw_static(flight, airline, from_airport, from_country,
+                    to_airport, to_country, aircraftmodel, type,
+                    reg, photo, dist_text, alt_text)
+        static_key = key
+        frames['full'] += 1
+    else:
+        frames['partial'] += 1
+
+    # The distance and altitude always end in miles and ft so text()'s
+    # check for repeated strings never skips them or the text after
+    # them, and the layout only depends on their heights
+    img = static_img.copy()
+    d = ImageDraw.Draw(img)
+    texts = [dist_text, alt_text]
+    for (slot, y) in dynamic:
+        (f, lx, w, h) = fit(texts[slot], 24, 10, 'l')
+        d.text((lx, y), texts[slot], (240, 240, 240), font=f)
+    return img
+
+
+# frame_summary returns a line with the frame counters
+def frame_summary():
+    return 'Frames: %d full, %d partial, %d skipped' % (
+        frames['full'], frames['partial'], frames['skipped'])
+
+
+# draw_blank returns a black image with screenText in the middle
+def draw_blank(screenText):
+    global last_frame
+    last_frame = None
+    img, d = new_frame()
+    text(d, 160, 180, screenText, 32, position='c')
+    return img
+
+
+# The aircraft selection screen is made of rows row_height pixels high,
+# rows_per_page of them to a page, with the page number underneath when
+# there is more than one page. Each row is drawn once as a tile (for
+# each label, highlighted or not) and kept in tiles. A page is put
+# together from its tiles the first time it's shown and after that a
+# button press only pastes the two rows whose highlight changed, so a
+# press takes the same time however many aircraft there are
+#
+# select_key says which page select_img shows and select_row is the
+# row highlighted on it
+
+row_height = 44
+rows_per_page = 10
+select_top = 6
+max_tiles = 200
+
+tiles = {}
+select_key = None
+select_img = None
+select_row = None
+
+
+# tile returns the row showing label, highlighted or not
+def tile(label, highlighted):
+    key = (label, highlighted)
+    t = tiles.get(key)
+    if t is not None:
+        return t
+
+    t = Image.new('RGB', (320, row_height), color=(0, 0, 0))
+    d = ImageDraw.Draw(t)
+    fitted = fit(label, 32, 160, 'c')
+    if fitted is not None:
+        (f, lx, w, h) = fitted
+        colour = (255, 255, 255) if highlighted else (150, 150, 150)
+        d.text((lx, max(0, (row_height - 6 - h) // 2)), label, colour, font=f)
+    d.line([(0, row_height - 3), (320, row_height - 3)])
+
+    if len(tiles) >= max_tiles:
+        tiles.clear()
+    tiles[key] = t
+    return t
+
+
+# draw_select returns the image of the list of aircraft in nearac to
+# choose from with the one at index highlighted (index len(nearac) is
+# Auto select). Only the page with index on it is shown
+def draw_select(nearac, index):
+    global last_frame
+    global select_key
+    global select_img
+    global select_row
+    last_frame = None
+
+    labels = [ac.flight or ac.hex.upper() for ac in nearac] + ['Auto select']
+    page = index // rows_per_page
+    pages = (len(labels) + rows_per_page - 1) // rows_per_page
+    shown = tuple(labels[page * rows_per_page:(page + 1) * rows_per_page])
+    row = index - page * rows_per_page
+
+    key = (shown, page, pages)
+    if key != select_key:
+        img, d = new_frame()
+        d.line([(0, 3), (320, 3)])
+        for r in range(len(shown)):
+            img.paste(tile(shown[r], False), (0, select_top + r * row_height))
+        if pages > 1:
+            text(d, 160, select_top + rows_per_page * row_height + 4,
+                 '%d/%d' % (page + 1, pages), 20, position='c', colour=(150, 150, 150))
+        select_key = key
+        select_img = img
+        select_row = None
+
+    if select_row is not None and select_row != row:
+        select_img.paste(tile(shown[select_row], False), (0, select_top + select_row * row_height))
+    select_img.paste(tile(shown[row], True), (0, select_top + row * row_height))
+    select_row = row
+
+    # The screen is given a copy so the next press can change this one
+    return select_img.copy()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+# Reads aircraft from dump1090's BaseStation (SBS-1) output, which is a
+# stream of comma separated lines on TCP port 30003 with one line per
+# message received. Instead of fetching and parsing the whole aircraft
+# table every poll, a thread keeps the connection open and applies each
+# message to a table of aircraft as it arrives. getplanes() then only
+# has to make records from the table. Aircraft that haven't been heard from for
+# expiry seconds are dropped, and the connection is made again if it
+# fails
+#
+# The lines look like
+#
+#   MSG,3,1,1,4CA2D6,1,2024/05/01,12:00:00.000,2024/05/01,12:00:00.000,,35000,,,51.4700,-0.4543,,,0,,0,0
+#
+# where the fields used are the message type (1), the hex code (4), the
+# callsign (10), altitude (11), ground speed (12), track (13), latitude
+# (14), longitude (15) and vertical rate (16). Most messages only fill
+# in some of them
+
+import socket
+import threading
+import time
+
+from planes_aircraft import records, from_dict
+from planes_config import SBS
+
+# Seconds to wait for the connection to be made and for data to arrive.
+# dump1090 sends nothing while there are no aircraft so a quiet
+# connection is only made again after read_timeout
+
+connect_timeout = 10
+read_timeout = 60
+
+# After a failure the connection is tried again after retry_interval
+# seconds, doubling each time up to max_retry_interval
+
+retry_interval = 1.0
+max_retry_interval = 30.0
+
+# Aircraft are dropped from the table expiry seconds after their last
+# message
+
+expiry = 60
+
+# aircraft maps a hex code to a dict of the fields received so far for
+# the aircraft (named as in aircraft.json) and heard maps it to when its last message arrived (on
+# the monotonic clock)
+
+aircraft = {}
+heard = {}
+lock = threading.Lock()
+
+connected = False
+thread = None
+
+# attempted is set once the first connection has been tried, so that
+# the first getplanes() can wait for it
+
+attempted = threading.Event()
+
+# Counters of what has been received
+
+stats = {
+    'connects': 0,
+    'messages': 0,
+    'bad': 0,
+    'expired': 0,
+}
+
+
+# parse returns the hex code of the aircraft in an SBS line and a dict
+# of the fields it gives, or None if it isn't a usable message. Fields
+# up to the vertical rate (field 17) must be there, even if empty
+def parse(line):
+    f = line.split(',')
+    if len(f) < 17 or f[0] != 'MSG' or f[4] == '':
+        return None
+
+    fields = {}
+    try:
+        if f[10] != '':
+            fields['flight'] = f[10]
+        if f[11] != '':
+            fields['altitude'] = int(float(f[11]))
+        if f[12] != '':
+            fields['speed'] = float(f[12])
+        if f[13] != '':
+            fields['track'] = float(f[13])
+        if f[14] != '' and f[15] != '':
+            fields['lat'] = float(f[14])
+            fields['lon'] = float(f[15])
+        if f[16] != '':
+            fields['vert_rate'] = float(f[16])
+    except ValueError:
+        return None
+
+    # Field 21 is set when the aircraft is on the ground, shown the same
+    # way as aircraft.json shows it
+    if len(f) > 21 and f[21].strip() in ('1', '-1'):
+        fields['altitude'] = 'ground'
+
+    return f[4].lower(), fields
+
+
+# apply adds the message in line to the table
+def apply(line, now):
+    parsed = parse(line)
+    if parsed is None:
+        stats['bad'] += 1
+        return
+
+    hexcode, fields = parsed
+    with lock:
+        ac = aircraft.get(hexcode)
+        if ac is None:
+            ac = {'hex': hexcode}
+            aircraft[hexcode] = ac
+        ac.update(fields)
+        if 'lat' in fields:
+            ac['pos_time'] = now
+        heard[hexcode] = now
+    stats['messages'] += 1
+
+
+# expire drops aircraft that haven't been heard from for expiry seconds
+def expire(now):
+    with lock:
+        for hexcode in [h for h, t in heard.items() if now - t > expiry]:
+            del aircraft[hexcode]
+            del heard[hexcode]
+            stats['expired'] += 1
+
+
+# read applies the lines arriving on sock to the table until the
+# connection closes or times out. Lines can be split across reads so the
+# part after the last newline is kept for the next one
+def read(sock):
+    partial = b''
+    last_expiry = time.monotonic()
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            return
+
+        lines = (partial + data).split(b'\n')
+        partial = lines.pop()
+        now = time.monotonic()
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            # A line that can't be handled is counted as bad and skipped
+            # rather than stopping the reader
+            try:
+                apply(line.decode('ascii', 'replace'), now)
+            except Exception as e:
+                stats['bad'] += 1
+                print("Bad SBS line %r: %s" % (line[:80], e))
+
+        if now - last_expiry >= 1:
+            expire(now)
+            last_expiry = now
+
+
+# run is the thread that keeps the connection to SBS open
+def run():
+    global connected
+
+    host, port = SBS.rsplit(':', 1)
+    delay = retry_interval
+    while True:
+        try:
+            sock = socket.create_connection((host, int(port)), timeout=connect_timeout)
+        except OSError:
+            attempted.set()
+            time.sleep(delay)
+            delay = min(max_retry_interval, delay * 2)
+            continue
+
+        stats['connects'] += 1
+        connected = True
+        attempted.set()
+        delay = retry_interval
+        try:
+            sock.settimeout(read_timeout)
+            read(sock)
+        except OSError:
+            pass
+        except Exception as e:
+            # Anything else is a bug, but the thread carries on and
+            # connects again rather than leaving the device without a feed
+            print("SBS reader failed: %s" % e)
+        finally:
+            connected = False
+            sock.close()
+        time.sleep(delay)
+
+
+# start starts the thread that reads the stream, if it hasn't been
+# already, and waits for it to try connecting
+def start():
+    global thread
+    if thread is None:
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        attempted.wait(connect_timeout + 1)
+
+
+# getplanes returns the aircraft in the table that have all the fields
+# needed, or "" if there's no connection to SBS and nothing left in the
+# table
+def getplanes():
+    start()
+    now = time.monotonic()
+    expire(now)
+    with lock:
+        if not connected and len(aircraft) == 0:
+            return ""
+        # seen_pos is the age of the position, as in aircraft.json
+        for ac in aircraft.values():
+            if 'pos_time' in ac:
+                ac['seen_pos'] = now - ac['pos_time']
+        return records(aircraft.values(), from_dict)
+
+
+# report returns a line describing what has been received
+def report():
+    return 'SBS: %d connections, %d messages, %d bad, %d expired, %d aircraft' % (
+        stats['connects'], stats['messages'], stats['bad'], stats['expired'], len(aircraft))
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+# WORKS OUT WHEN TO POLL THE FEED NEXT
+#
+# Polls are due at fixed points on the monotonic clock rather than a
+# fixed time after the last one finished, so the time taken to draw
+# the screen, fetch details and turn the model doesn't make the polls
+# drift. The gap between polls changes with the traffic: it's longest
+# when there's nothing about, shorter when the tracked aircraft is close
+# or closing fast, and grows each time the feed can't be read.
+#
+# If a cycle takes longer than the gap the missed poll is made straight
+# away and counted as an overrun, which shows the loop can't keep up.
+
+import time
+
+# The gaps between polls in seconds. tracking_interval is used when an
+# aircraft is tracked. When there are no aircraft nearby the gap starts
+# at tracking_interval and doubles with each empty poll in a row up to
+# empty_interval. The gap is never less than min_interval
+
+empty_interval = 30.0
+tracking_interval = 5.0
+min_interval = 1.0
+
+# Within close_distance miles the gap shrinks in proportion to the
+# distance. When the tracked aircraft is closing, the gap is kept short
+# enough that it moves no more than max_move miles between polls
+
+close_distance = 5.0
+max_move = 0.5
+
+# When the feed can't be read the gap starts at error_interval and
+# doubles with each failure in a row up to max_error_interval
+
+error_interval = 5.0
+max_error_interval = 60.0
+
+# next_poll is when the next poll is due and interval is the gap that
+# was used to work it out. cycle_start is when the current cycle began
+
+next_poll = None
+interval = tracking_interval
+cycle_start = None
+errors = 0
+empties = 0
+
+# The aircraft being tracked, its distance and when it was measured,
+# used to work out how fast it is closing
+
+tracked_hex = None
+tracked_dist = None
+tracked_time = None
+
+# Counters of how the loop is keeping up. busy is the time spent
+# working and late the total time overrunning polls were late by, both
+# in seconds
+
+stats = {
+    'cycles': 0,
+    'overruns': 0,
+    'busy': 0.0,
+    'late': 0.0,
+    'max_late': 0.0,
+}
+
+
+# begin is called at the start of each cycle, just before the feed is
+# polled
+def begin():
+    global cycle_start
+    cycle_start = time.monotonic()
+    stats['cycles'] += 1
+
+
+# plan sets the next poll to be gap seconds after the last one was due
+# and returns it. If that time has already gone the poll is made now
+# and the cycle is counted as an overrun
+def plan(gap):
+    global next_poll
+    global interval
+
+    now = time.monotonic()
+    start = cycle_start if cycle_start is not None else now
+    stats['busy'] += now - start
+
+    interval = gap
+    if next_poll is None:
+        next_poll = start
+    next_poll += gap
+    if next_poll < now:
+        late = now - next_poll
+        stats['overruns'] += 1
+        stats['late'] += late
+        stats['max_late'] = max(stats['max_late'], late)
+        next_poll = now
+    return next_poll
+
+
+# remaining returns the number of seconds until the next poll is due
+def remaining():
+    if next_poll is None:
+        return 0.0
+    return max(0.0, next_poll - time.monotonic())
+
+
+# restart makes the next poll due gap seconds from now, used after
+# the button is pressed so that the selection screen stays up
+def restart(gap=None):
+    global next_poll
+    if gap is None:
+        gap = interval
+    next_poll = time.monotonic() + gap
+
+
+# tracking plans the next poll while the aircraft hexcode is dist miles
+# away
+def tracking(hexcode, dist):
+    global errors
+    global empties
+    global tracked_hex
+    global tracked_dist
+    global tracked_time
+
+    errors = 0
+    empties = 0
+    now = time.monotonic()
+    gap = tracking_interval
+
+    if dist < close_distance:
+        gap = tracking_interval * dist / close_distance
+
+    if hexcode == tracked_hex and tracked_time is not None and now > tracked_time:
+        closing = (tracked_dist - dist) / (now - tracked_time)
+        if closing > 0:
+            gap = min(gap, max_move / closing)
+
+    tracked_hex = hexcode
+    tracked_dist = dist
+    tracked_time = now
+    return plan(max(min_interval, gap))
+
+
+# empty plans the next poll when there are no aircraft nearby, backing
+# off while the sky stays empty. empties stops going up once the gap
+# reaches empty_interval, so it can't grow without end
+def empty():
+    global errors
+    global empties
+    global tracked_hex
+    errors = 0
+    tracked_hex = None
+    gap = min(empty_interval, tracking_interval * 2 ** empties)
+    if gap < empty_interval:
+        empties += 1
+    return plan(gap)
+
+
+# failed plans the next poll after the feed couldn't be read, backing
+# off while the failures continue. As in empty, errors stops going up
+# once the gap reaches max_error_interval
+def failed():
+    global errors
+    global empties
+    global tracked_hex
+    tracked_hex = None
+    empties = 0
+    gap = min(max_error_interval, error_interval * 2 ** errors)
+    if gap < max_error_interval:
+        errors += 1
+    return plan(gap)
+
+
+# summary returns a line describing how the loop is keeping up
+def summary():
+    cycles = max(stats['cycles'], 1)
+    return ('Schedule: %d cycles every %.1fs, %d overruns (%.1f%%), '
+            '%.0f ms busy per cycle, late by up to %.0f ms' % (
+                stats['cycles'], interval, stats['overruns'],
+                100.0 * stats['overruns'] / cycles,
+                1000 * stats['busy'] / cycles, 1000 * stats['max_late']))
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+# Picks the aircraft worth showing out of everything in a poll. Aircraft
+# that can't be near enough are thrown away using a grid of cells
+# around the device before any trigonometry is done, and only the k
+# nearest of the rest are put in order
+
+import math
+
+from planes_config import MY_LAT, MY_LONG, MAX_RANGE, MAX_ALTITUDE
+from planes_geo import batch, earth_radius
+
+# The grid divides the world into cells cell_size degrees square. Only
+# aircraft in a cell that has some part within MAX_RANGE of the device
+# get their distance worked out
+
+cell_size = 0.25
+cell_columns = int(360 / cell_size)
+
+# A cell is kept if its nearest corner or edge is within MAX_RANGE plus
+# this many nautical miles, to allow for the approximations in
+# cell_distance
+
+cell_margin = 2.0
+
+
+# cell returns the (row, column) of the grid cell containing lat, lon
+def cell(lat, lon):
+    return int(lat // cell_size), int(((lon + 180) % 360) // cell_size)
+
+
+# cell_distance returns roughly the shortest distance in nautical miles
+# from the device to any point in the cell at row, col
+def cell_distance(row, col):
+    lat1 = row * cell_size
+    lat2 = lat1 + cell_size
+    lon1 = col * cell_size - 180
+    lon2 = lon1 + cell_size
+
+    # The nearest point of the cell is the device's position clamped to
+    # the cell's edges (taking the shortest way round in longitude)
+    lat = min(max(MY_LAT, lat1), lat2)
+    lon = MY_LONG
+    if not (lon1 <= lon <= lon2):
+        lon = min([lon1, lon2], key=lambda l: abs((l - MY_LONG + 180) % 360 - 180))
+
+    p1 = math.radians(MY_LAT)
+    p2 = math.radians(lat)
+    h = (math.sin((p2 - p1) / 2) ** 2 +
+         math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon - MY_LONG) / 2) ** 2)
+    return 2 * earth_radius * math.asin(math.sqrt(min(1.0, h)))
+
+
+# grid_cells returns the set of cells that have some part within radius
+# nautical miles of the device
+def grid_cells(radius):
+    cells = set()
+    home_row, home_col = cell(MY_LAT, MY_LONG)
+
+    # One degree of latitude is 60 nautical miles, longitude shrinks
+    # towards the poles
+    rows = int(radius / 60 / cell_size) + 2
+    coslat = math.cos(math.radians(min(89.0, abs(MY_LAT) + rows * cell_size)))
+    cols = min(cell_columns // 2, int(radius / (60 * coslat) / cell_size) + 2)
+
+    for row in range(home_row - rows, home_row + rows + 1):
+        if row * cell_size >= 90 or (row + 1) * cell_size <= -90:
+            continue
+        for col in range(home_col - cols, home_col + cols + 1):
+            col %= cell_columns
+            if cell_distance(row, col) <= radius + cell_margin:
+                cells.add((row, col))
+    return cells
+
+
+# The grid never changes while running so it's worked out once along
+# with the band of latitude it covers, which is checked first as it
+# rejects most far away aircraft with a couple of comparisons
+
+in_range = None
+lat_min = -90.0
+lat_max = 90.0
+if MAX_RANGE > 0:
+    in_range = grid_cells(MAX_RANGE)
+    lat_min = min([row for row, col in in_range]) * cell_size
+    lat_max = (max([row for row, col in in_range]) + 1) * cell_size
+
+
+# usable returns True if aircraft ac (a planes_aircraft.Aircraft, which
+# has already been checked for missing fields and ground traffic)
+# passes the altitude and grid checks
+def usable(ac):
+    if MAX_ALTITUDE > 0 and ac.altitude > MAX_ALTITUDE:
+        return False
+
+    lat = ac.lat
+    if lat < lat_min or lat > lat_max:
+        return False
+    if in_range is not None and cell(lat, ac.lon) not in in_range:
+        return False
+
+    return True
+
+
+# nearest filters planes down to the ones worth showing and returns
+# three lists (near, dists, bearings) for the k nearest of them, nearest
+# first. If lock is the hex of an aircraft that is in range but not one
+# of the k nearest it is added to the end so that a locked aircraft
+# isn't lost just because others are closer
+def nearest(planes, k=None, lock=None):
+    candidates = []
+    lats = []
+    lons = []
+    for ac in planes:
+        if usable(ac):
+            candidates.append(ac)
+            lats.append(ac.lat)
+            lons.append(ac.lon)
+
+    dists, bearings, order = batch(lats, lons, k)
+
+    # The grid is only a rough cut so apply the exact range now
+    if MAX_RANGE > 0:
+        order = [i for i in order if dists[i] <= MAX_RANGE]
+
+    if lock is not None:
+        for i in order:
+            if candidates[i].hex == lock:
+                break
+        else:
+            for i in range(len(candidates)):
+                if candidates[i].hex == lock and (MAX_RANGE <= 0 or dists[i] <= MAX_RANGE):
+                    order.append(i)
+                    break
+
+    return ([candidates[i] for i in order],
+            [dists[i] for i in order],
+            [bearings[i] for i in order])
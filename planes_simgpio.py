@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# A stand-in for RPi.GPIO that runs anywhere. It has the parts of the
+# RPi.GPIO interface that aeronear uses, remembers what was written to
+# each output and lets inputs be set (for example to press the button)
+# with set_input. Use it with
+#
+#   import planes_simgpio as GPIO
+#
+# FakeStrip is a stand-in for a neopixel.NeoPixel strip created with
+# auto_write=False
+
+import threading
+
+BCM = 11
+BOARD = 10
+OUT = 0
+IN = 1
+LOW = 0
+HIGH = 1
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+RISING = 31
+FALLING = 32
+BOTH = 33
+
+# pins maps a pin number to its current level. outputs counts the
+# writes to each output pin. callbacks maps a pin to (edge, callback)
+
+pins = {}
+outputs = {}
+callbacks = {}
+
+lock = threading.Lock()
+
+
+def setmode(mode):
+    pass
+
+
+def setwarnings(flag):
+    pass
+
+
+def setup(pin, direction, pull_up_down=PUD_OFF, initial=LOW):
+    with lock:
+        if pull_up_down == PUD_UP:
+            pins[pin] = HIGH
+        else:
+            pins[pin] = initial
+
+
+def output(pin, value):
+    with lock:
+        pins[pin] = HIGH if value else LOW
+        outputs[pin] = outputs.get(pin, 0) + 1
+
+
+def input(pin):
+    return pins.get(pin, LOW)
+
+
+def add_event_detect(pin, edge, callback=None, bouncetime=None):
+    with lock:
+        callbacks[pin] = (edge, callback)
+
+
+def remove_event_detect(pin):
+    with lock:
+        callbacks.pop(pin, None)
+
+
+def cleanup():
+    with lock:
+        pins.clear()
+        outputs.clear()
+        callbacks.clear()
+
+
+# set_input sets the level of an input pin, calling any callback
+# registered for that edge like RPi.GPIO does (from the calling thread)
+def set_input(pin, value):
+    with lock:
+        old = pins.get(pin, LOW)
+        pins[pin] = HIGH if value else LOW
+        edge, callback = callbacks.get(pin, (None, None))
+
+    if callback is None or old == pins[pin]:
+        return
+    rising = pins[pin] == HIGH
+    if edge == BOTH or (edge == RISING and rising) or (edge == FALLING and not rising):
+        callback(pin)
+
+
+# FakeStrip keeps the pixels set on it and, in shown, the pixels the LEDs
+# would be showing after the last show(). It counts the pixels set and
+# the calls to show()
+class FakeStrip:
+    def __init__(self, n):
+        self.pixels = [(0, 0, 0)] * n
+        self.shown = list(self.pixels)
+        self.writes = 0
+        self.shows = 0
+
+    def __len__(self):
+        return len(self.pixels)
+
+    def __getitem__(self, i):
+        return self.pixels[i]
+
+    def __setitem__(self, i, colour):
+        self.pixels[i] = tuple(colour)
+        self.writes += 1
+
+    def fill(self, colour):
+        for i in range(len(self.pixels)):
+            self[i] = colour
+
+    def show(self):
+        self.shown = list(self.pixels)
+        self.shows += 1
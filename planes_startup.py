@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+# Measures how long the program takes to start. Times are from when the
+# process started (read from /proc, so starting Python and importing
+# the first modules count too) to each point marked, like the first
+# frame on the screen and the main loop being ready
+
+import os
+import time
+
+
+# process_age returns how many seconds ago the process started, or 0 if
+# that can't be found out
+def process_age():
+    try:
+        with open('/proc/self/stat') as f:
+            stat = f.read()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        # The command name can have spaces in so the fields are counted
+        # from after it. starttime is field 22, in clock ticks after boot
+        fields = stat[stat.rindex(')') + 2:].split()
+        ticks = int(fields[19])
+        return max(0.0, uptime - ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+# started is when the process started on the monotonic clock and marks
+# maps the name of each point marked to the seconds it took to reach
+
+started = time.monotonic() - process_age()
+marks = {}
+
+
+# mark records that the point name has been reached and returns how
+# many seconds it took
+def mark(name):
+    marks[name] = time.monotonic() - started
+    return marks[name]
+
+
+# summary returns a line with the time taken to reach each point
+def summary():
+    parts = ['%s after %.2f s' % (name.replace('_', ' '), t) for name, t in marks.items()]
+    return 'Startup: %s' % (', '.join(parts) or 'nothing marked')
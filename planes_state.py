@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+# A small store for the state that has to survive a restart: north (the
+# LED that points north) and position (where the stepper motor is),
+# and anything else added later. It is kept in planes_state.json.
+#
+# Changes are only written once they have stopped for settle seconds,
+# so a run of moves of the model aircraft is one write rather than one
+# per move, and never later than max_delay seconds after the first
+# unwritten change. The file is written to a temporary file, synced and
+# renamed over the old one, so a power cut leaves either the old state
+# or the new one and never half a file. Anything unwritten is written
+# when the program exits, including when it is stopped with SIGTERM
+
+import atexit
+import json
+import os
+import re
+import signal
+import threading
+import time
+
+state_file = 'planes_state.json'
+
+# Installs from before the store saved north and position in this
+# Python file, which is read (not imported) if there is no state file.
+# The file stays in the tree with its uncalibrated defaults for now, so
+# that updating an install doesn't delete its calibration before it has
+# been moved over
+
+old_file = 'planes_position.py'
+
+defaults = {
+    'north': -1,
+    'position': -1,
+}
+
+# Seconds to wait for changes to stop before writing, and the longest
+# a change can go unwritten
+
+settle = 10.0
+max_delay = 120.0
+
+# state is the current state. While there are unwritten changes
+# first_change and last_change are when the first and last of them
+# were made, on the monotonic clock
+
+state = dict(defaults)
+first_change = None
+last_change = None
+condition = threading.Condition()
+write_lock = threading.Lock()
+thread = None
+
+# Counters of how many changes were made and how many writes they took.
+# unchanged counts updates that didn't change anything
+
+stats = {
+    'updates': 0,
+    'unchanged': 0,
+    'writes': 0,
+    'failed': 0,
+}
+started = time.monotonic()
+
+
+# read_old returns the values in an old planes_position.py or {} if
+# there isn't one. Every line is name = number
+def read_old(filename):
+    values = {}
+    try:
+        with open(filename) as f:
+            for line in f:
+                m = re.match(r'\s*(\w+)\s*=\s*(-?[0-9]+)\s*$', line)
+                if m:
+                    values[m.group(1)] = int(m.group(2))
+    except OSError:
+        pass
+    return values
+
+
+# load reads the state from state_file, or from an old planes_position.py
+# if there isn't one. Anything missing is left at its default
+def load():
+    try:
+        with open(state_file) as f:
+            values = json.load(f)
+        if not isinstance(values, dict):
+            values = {}
+    except (OSError, ValueError):
+        values = read_old(old_file)
+    with condition:
+        state.update(values)
+
+
+# get returns the value of name
+def get(name):
+    with condition:
+        return state.get(name, defaults.get(name))
+
+
+# update sets the values given (e.g. update(position=100)) and has them
+# written once the changes settle
+def update(**values):
+    global first_change
+    global last_change
+
+    with condition:
+        stats['updates'] += 1
+        if all(state.get(k) == v for k, v in values.items()):
+            stats['unchanged'] += 1
+            return
+        state.update(values)
+        now = time.monotonic()
+        if first_change is None:
+            first_change = now
+        last_change = now
+        condition.notify_all()
+    start()
+
+
+# take returns a copy of the state to write and marks it written, or
+# None if there's nothing to write. Must be called with condition held
+def take():
+    global first_change
+    global last_change
+
+    if first_change is None:
+        return None
+    first_change = None
+    last_change = None
+    return dict(state)
+
+
+# write writes values to state_file atomically
+def write(values):
+    with write_lock:
+        try:
+            with open(state_file + '.tmp', 'w') as f:
+                json.dump(values, f, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(state_file + '.tmp', state_file)
+            stats['writes'] += 1
+        except OSError as e:
+            stats['failed'] += 1
+            print("State not saved: %s" % e)
+
+
+# flush writes any unwritten changes now. It is used when a change
+# mustn't be lost, like a new north, and when the program exits
+def flush():
+    with condition:
+        values = take()
+    if values is not None:
+        write(values)
+
+
+# run is the thread that writes the changes once they have settled
+def run():
+    while True:
+        with condition:
+            condition.wait_for(lambda: first_change is not None)
+            while first_change is not None:
+                due = min(last_change + settle, first_change + max_delay)
+                wait = due - time.monotonic()
+                if wait <= 0:
+                    break
+                condition.wait(wait)
+            values = take()
+        if values is not None:
+            write(values)
+
+
+# start starts the thread that writes the changes. It does nothing if
+# it has already been called
+def start():
+    global thread
+    with condition:
+        if thread is not None:
+            return
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+    atexit.register(flush)
+
+
+# terminate is the SIGTERM handler. SIGTERM (systemctl stop, shutting
+# down) doesn't run atexit handlers on its own, so it is turned into an
+# ordinary exit, which does, and the unwritten changes are flushed
+def terminate(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+# install sets up SIGTERM to exit through the atexit handlers. It must
+# be called from the main thread
+def install():
+    signal.signal(signal.SIGTERM, terminate)
+
+
+# summary returns a line describing how many changes have been made and
+# how many writes they took
+def summary():
+    hours = max(time.monotonic() - started, 1) / 3600
+    return 'State: %d updates (%d unchanged), %d writes, %.1f writes/hour' % (
+        stats['updates'], stats['unchanged'], stats['writes'], stats['writes'] / hours)
+
+
+load()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+# WORKS OUT WHERE AIRCRAFT ARE BETWEEN POLLS OF THE FEED
+#
+# Each aircraft's last few positions (fixes) are kept and used to carry
+# its position forward from the last fix by dead reckoning, so that the
+# distance, the LED showing where to look and the altitude can be
+# updated several times a second while the feed is only polled every
+# few seconds. The ground speed and vertical rate are used when the
+# feed gives them, otherwise they are worked out from the fixes.
+#
+# Every time a new fix arrives it is compared with where the aircraft
+# was predicted to be, so the error can be checked.
+
+import collections
+import math
+import time
+
+import haversine
+
+from planes_aircraft import Aircraft
+
+# history is the number of fixes kept per aircraft. Positions are never
+# carried forward more than max_ahead seconds past the last fix, and an
+# aircraft is forgotten forget seconds after its last fix
+
+history = 4
+max_ahead = 30.0
+forget = 120.0
+
+# Altitudes are given in steps of altitude_step feet so predicted ones
+# are rounded to match
+
+altitude_step = 25
+
+# tracks maps a hex code to the Track of that aircraft
+
+tracks = {}
+
+# Counters of how good the predictions have been. error is the total
+# distance in nautical miles between predictions and the fixes that
+# followed, and frozen is what it would have been without predicting
+# (just showing the last fix)
+
+stats = {
+    'fixes': 0,
+    'checked': 0,
+    'error': 0.0,
+    'max_error': 0.0,
+    'frozen': 0.0,
+}
+
+
+# separation returns the distance in nautical miles between aircraft a
+# and b
+def separation(a, b):
+    return haversine.haversine((a.lat, a.lon), (b.lat, b.lon), unit=haversine.Unit.NAUTICAL_MILES)
+
+
+# moved returns a copy of aircraft ac moved nm nautical miles along
+# course degrees and climbed feet feet. Over the short distances moved
+# between fixes the earth can be taken as flat
+def moved(ac, nm, course, feet):
+    c = math.radians(course)
+    lat = ac.lat + nm * math.cos(c) / 60
+    lon = ac.lon + nm * math.sin(c) / (60 * max(0.01, math.cos(math.radians(lat))))
+    lon = (lon + 180) % 360 - 180
+    lat = max(-90.0, min(90.0, lat))
+    altitude = ac.altitude
+    if feet != 0:
+        altitude = int(round((altitude + feet) / altitude_step)) * altitude_step
+    return Aircraft(ac.hex, ac.flight, lat, lon, ac.track, altitude,
+                    ac.speed, ac.vert_rate, 0.0)
+
+
+# Track keeps the fixes of one aircraft as (time, Aircraft) and the
+# speed (knots), course (degrees) and climb (feet per minute) worked
+# out from them
+class Track:
+    def __init__(self):
+        self.fixes = collections.deque(maxlen=history)
+        self.speed = 0.0
+        self.course = 0.0
+        self.climb = 0.0
+
+    # add adds a fix for the aircraft ac at time t and works out the
+    # velocity again. Any speed or vertical rate the feed doesn't give is
+    # taken from the oldest fix kept
+    def add(self, t, ac):
+        self.fixes.append((t, ac))
+        self.speed = ac.speed
+        self.course = ac.track
+        self.climb = ac.vert_rate
+
+        t0, first = self.fixes[0]
+        dt = t - t0
+        if self.speed is None:
+            self.speed = separation(first, ac) / dt * 3600 if dt > 0 else 0.0
+        if self.climb is None:
+            self.climb = (ac.altitude - first.altitude) / dt * 60 if dt > 0 else 0.0
+
+    # last returns the time and Aircraft of the latest fix
+    def last(self):
+        return self.fixes[-1]
+
+    # predict returns the Aircraft moved to where it should be at time t
+    def predict(self, t):
+        t0, ac = self.fixes[-1]
+        dt = min(max(0.0, t - t0), max_ahead)
+        return moved(ac, self.speed * dt / 3600, self.course, self.climb * dt / 60)
+
+
+# update adds the positions of the aircraft in planes (read from the feed
+# at time now on the monotonic clock) to their tracks. A fix is only new
+# if the position has changed, since an unchanged feed gives the same
+# positions again
+def update(planes, now=None):
+    if now is None:
+        now = time.monotonic()
+
+    for ac in planes:
+        t = now - ac.seen
+        track = tracks.get(ac.hex)
+        if track is None:
+            track = Track()
+            tracks[ac.hex] = track
+        else:
+            t0, last = track.last()
+            if last.lat == ac.lat and last.lon == ac.lon:
+                continue
+            if t > t0:
+                error = separation(track.predict(t), ac)
+                stats['checked'] += 1
+                stats['error'] += error
+                stats['max_error'] = max(stats['max_error'], error)
+                stats['frozen'] += separation(last, ac)
+        track.add(t, ac)
+        stats['fixes'] += 1
+
+    for hexcode in [h for h, track in tracks.items() if now - track.last()[0] > forget]:
+        del tracks[hexcode]
+
+
+# predict returns aircraft ac moved to where it should be at time now,
+# or ac itself if it has no track
+def predict(ac, now=None):
+    if now is None:
+        now = time.monotonic()
+    track = tracks.get(ac.hex)
+    if track is None:
+        return ac
+    return track.predict(now)
+
+
+# summary returns a line describing how close the predictions were to
+# the fixes that followed them
+def summary():
+    checked = max(stats['checked'], 1)
+    return ('Dead reckoning: %d fixes, %d checked, error %.3f nm average, %.3f nm worst '
+            '(%.3f nm average without)' % (
+                stats['fixes'], stats['checked'], stats['error'] / checked,
+                stats['max_error'], stats['frozen'] / checked))